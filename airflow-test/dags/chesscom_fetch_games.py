@@ -1,6 +1,7 @@
 import datetime
 import airflow
 from airflow.decorators import task, dag
+from commons.Config import Config
 
 default_args = {
     "owner": "airflow",
@@ -8,7 +9,12 @@ default_args = {
     "retry_delay": datetime.timedelta(minutes=8)
 }
 
-    
+GAMES_SHARDS = Config.get("GAMES_SHARDS")
+# Ogni task nel pool usa un proprio rate limiter (REQUEST_RATE richieste/s):
+# il carico massimo su Chess.com è quindi slot del pool × REQUEST_RATE
+CHESSCOM_POOL = Config.get("AIRFLOW_CHESSCOM_POOL")
+
+
 @dag(
     dag_id="chesscom_fetch_games",
     default_args=default_args,
@@ -16,10 +22,55 @@ default_args = {
     schedule_interval="0 12 * * *",
     max_active_runs=1,
     catchup=False,
+    params={"incremental": True},
     tags=["BE"]
 )
 def generate_dag():
+    """
+    Ingestione delle partite divisa in shard: i giocatori vengono ripartiti per hash
+    dello username, ogni shard esegue lo staging su GCS in un task separato
+    (anche su worker diversi) e un ultimo task carica tutto in BigQuery con pochi load job.
+    """
+
+    @task
+    def get_player_shards() -> list:
+        from commons.chesscom_data_collector import ChesscomDataCollector
+        from commons.sharding import shard_players
+
+        players = ChesscomDataCollector().get_existing_players()
+        shards = shard_players(players, GAMES_SHARDS)
+        print(f"🔹 {len(players)} giocatori divisi in {len(shards)} shard")
+        return shards
+
+    @task(pool=CHESSCOM_POOL, retries=1)
+    def stage_shard(players: list, params=None) -> dict:
+        import time
+        from commons.chesscom_data_collector import ChesscomDataCollector
+        from commons.metrics import get_metrics
+
+        incremental = bool((params or {}).get("incremental", True))
+        start, since = time.perf_counter(), get_metrics().snapshot()
+        staged = ChesscomDataCollector().stage_games(players, incremental=incremental)
+        ChesscomDataCollector.report_run("chesscom_stage_shard", start, since)
+        return staged
+
     @task
-    def print():
-        print("aaaa")
+    def load_and_commit(staged_shards) -> int:
+        import time
+        from commons.chesscom_data_collector import ChesscomDataCollector
+        from commons.metrics import get_metrics
+
+        staged = {}
+        for shard in staged_shards:
+            staged.update(shard or {})
+        start, since = time.perf_counter(), get_metrics().snapshot()
+        committed = ChesscomDataCollector().commit_staged_games(staged)
+        ChesscomDataCollector.report_run("chesscom_load_and_commit", start, since)
+        print(f"✅ Partite caricate per {len(committed)}/{len(staged)} giocatori")
+        return len(committed)
+
+    staged_shards = stage_shard.expand(players=get_player_shards())
+    load_and_commit(staged_shards)
+
+
 generate_dag()
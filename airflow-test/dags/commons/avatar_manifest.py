@@ -0,0 +1,68 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+AVATAR_FIELDS = ["original_avatar_url", "avatar_storage_url"]
+
+
+class AvatarManifest:
+    """
+    Elenco degli avatar già salvati nel bucket, costruito dai campi
+    original_avatar_url / avatar_storage_url dei documenti dei giocatori.
+    Un avatar con URL invariato non richiede chiamate di rete.
+    """
+
+    def __init__(self) -> None:
+        self._avatars: Dict[str, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, docs: Iterable) -> None:
+        """Carica il manifest dai documenti Firestore (anche proiettati su AVATAR_FIELDS)."""
+        avatars = {}
+        for doc in docs:
+            data = doc.to_dict() or {}
+            original_url = data.get("original_avatar_url")
+            stored_url = data.get("avatar_storage_url")
+            if original_url and stored_url:
+                avatars[doc.id.lower()] = (original_url, stored_url)
+        with self._lock:
+            self._avatars = avatars
+
+    def lookup(self, username: str, avatar_url: str) -> Optional[str]:
+        """Ritorna l'URL nel bucket se l'avatar è già stato salvato con lo stesso URL originale."""
+        entry = self._avatars.get(username.lower())
+        if entry and entry[0] == avatar_url:
+            return entry[1]
+        return None
+
+    def record(self, username: str, avatar_url: str, stored_url: str) -> None:
+        with self._lock:
+            self._avatars[username.lower()] = (avatar_url, stored_url)
+
+
+class AvatarUploader:
+    """Scarica e salva in parallelo, fuori dal ciclo principale, gli avatar nuovi o cambiati."""
+
+    def __init__(self, store: Callable[[str, str], Optional[str]], max_workers: int = 8) -> None:
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="avatar-upload")
+        self._futures: List[Future] = []
+
+    def submit(self, username: str, avatar_url: str) -> Future:
+        future = self._executor.submit(self.store, username, avatar_url)
+        self._futures.append(future)
+        return future
+
+    def wait(self) -> Tuple[int, int]:
+        """Attende gli upload in corso e ritorna (salvati, falliti)."""
+        stored, failed = 0, 0
+        for future in self._futures:
+            try:
+                if future.result():
+                    stored += 1
+                else:
+                    failed += 1
+            except Exception:
+                failed += 1
+        self._executor.shutdown(wait=True)
+        return stored, failed
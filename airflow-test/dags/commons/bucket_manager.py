@@ -1,27 +1,50 @@
-from google.cloud import storage
 import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from commons.client_registry import get_storage_client
+from commons.metrics import get_metrics
+from commons.Config import Config
+
+logger = Config.init_logging()
+
+# Numero massimo di richieste in una batch della JSON API di GCS
+GCS_BATCH_SIZE = 100
 
 class BucketManager:
     """Gestisce l'inizializzazione e lo svuotamento di un bucket GCS."""
 
-    def __init__(self, bucket_name: str) -> None:
-        self.storage_client = storage.Client()
+    # Bucket già verificati da questo processo
+    _validated_buckets = set()
+
+    def __init__(self, bucket_name: str, max_workers: int = 16) -> None:
         self.bucket_name = bucket_name
-        self.bucket = self.storage_client.bucket(bucket_name)
+        self.max_workers = max_workers
         self._validate_bucket()
 
+    @property
+    def storage_client(self):
+        # Il client Storage è condiviso da tutto il processo e ricreato dopo un fork
+        return get_storage_client()
+
+    @property
+    def bucket(self):
+        return self.storage_client.bucket(self.bucket_name)
+
     def _validate_bucket(self) -> None:
         """Verifica che il bucket esista e sia accessibile."""
+        if self.bucket_name in BucketManager._validated_buckets:
+            return
         if not self.bucket.exists():
             error_msg = f"Bucket {self.bucket_name} non esiste!"
             logging.critical(error_msg)
             raise ValueError(error_msg)
+        BucketManager._validated_buckets.add(self.bucket_name)
     
     def empty_bucket(self) -> None:
         """Svuota completamente il bucket eliminando tutti gli oggetti."""
-        blobs = self.bucket.list_blobs()
-        for blob in blobs:
-            blob.delete()
+        self.delete_blobs(self.list_files())
         logging.info(f"Il bucket {self.bucket_name} è stato svuotato con successo.")
     
     def get_blob(self, blob_name: str):
@@ -38,16 +61,65 @@ class BucketManager:
         """
         Elimina tutti i file sotto un determinato percorso nel bucket.
         """
-        blobs = self.bucket.list_blobs(prefix=prefix)
-        deleted_files = [blob.name for blob in blobs]
+        deleted_files = self.list_files(prefix=prefix)
 
         if not deleted_files:
             return
 
-        for blob_name in deleted_files:
-            self.bucket.blob(blob_name).delete()
+        self.delete_blobs(deleted_files)
+
+    def delete_blobs(self, blob_names: List[str], operation: str = "delete") -> Dict[str, float]:
+        """Elimina i blob indicati con la batch API di GCS, fino a 100 eliminazioni per richiesta HTTP."""
+        start = time.perf_counter()
+        for i in range(0, len(blob_names), GCS_BATCH_SIZE):
+            with self.storage_client.batch():
+                for blob_name in blob_names[i:i + GCS_BATCH_SIZE]:
+                    self.bucket.blob(blob_name).delete()
+        return self._report(operation, len(blob_names), 0, start)
     
     def upload_file(self, local_file_path: str, destination_blob_path: str) -> None:
 
         blob = self.bucket.blob(destination_blob_path)
-        blob.upload_from_filename(local_file_path)
\ No newline at end of file
+        blob.upload_from_filename(local_file_path)
+
+    def upload_files(self, files: List[Tuple[str, str]], max_workers: Optional[int] = None,
+                     operation: str = "upload") -> Dict[str, float]:
+        """Carica in parallelo una lista di coppie (file locale, blob di destinazione)."""
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_workers) as executor:
+            list(executor.map(lambda pair: self.upload_file(*pair), files))
+        total_bytes = sum(os.path.getsize(local_path) for local_path, _ in files)
+        return self._report(operation, len(files), total_bytes, start)
+
+    def download_file(self, blob_name: str, local_file_path: str) -> None:
+        self.bucket.blob(blob_name).download_to_filename(local_file_path)
+
+    def download_files(self, files: List[Tuple[str, str]], max_workers: Optional[int] = None,
+                       operation: str = "download") -> Dict[str, float]:
+        """Scarica in parallelo una lista di coppie (blob, file locale di destinazione)."""
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_workers) as executor:
+            list(executor.map(lambda pair: self.download_file(*pair), files))
+        total_bytes = sum(os.path.getsize(local_path) for _, local_path in files)
+        return self._report(operation, len(files), total_bytes, start)
+
+    def _report(self, operation: str, files: int, total_bytes: int, start: float) -> Dict[str, float]:
+        """Registra nelle metriche e nei log e ritorna il throughput di un'operazione sul bucket."""
+        seconds = time.perf_counter() - start
+        stats = {
+            "files": files,
+            "bytes": total_bytes,
+            "seconds": seconds,
+            "files_per_sec": files / seconds if seconds else 0.0,
+            "mb_per_sec": total_bytes / seconds / 1_000_000 if seconds else 0.0,
+        }
+        metrics = get_metrics()
+        metrics.inc("chesscom_gcs_files_total", files, operation=operation)
+        if total_bytes:
+            metrics.inc("chesscom_gcs_bytes_total", total_bytes, operation=operation)
+        logger.log_text(
+            f"{self.bucket_name} {operation}: {files} file, {total_bytes / 1_000_000:.1f} MB "
+            f"in {seconds:.2f}s ({stats['files_per_sec']:.1f} file/s, {stats['mb_per_sec']:.2f} MB/s)",
+            severity="DEBUG"
+        )
+        return stats
\ No newline at end of file
@@ -1,4 +1,5 @@
 import requests
+import asyncio
 import datetime
 import time
 import os
@@ -6,45 +7,81 @@ import json
 import hashlib
 import urllib.parse
 from google.cloud import firestore, storage
-from typing import Optional, Dict, Any, Tuple, List
-import re
+from typing import Optional, Dict, Any, Tuple, List, Union, Callable
 from google.cloud import bigquery
 from commons.firestore_connection import FirestoreConnection
 from commons.bigquery_connection import BigQueryConnection
 from commons.bucket_manager import BucketManager
+from commons.http_client import ChesscomHttpClient, get_http_client
+from commons.archive_cache import ArchiveCache
+from commons import local_game_store
+from commons.position_index import PositionIndex
+from commons.staging_writer import GameStagingWriter
+from commons.firestore_batch_writer import FirestoreBatchWriter
+from commons.avatar_manifest import AvatarManifest, AvatarUploader, AVATAR_FIELDS
+from commons import pgn_tokenizer, opening_stats
+from commons.metrics import get_metrics
 from commons.Config import Config
-import pandas as pd
 
 PROJECT = Config.get("PROJECT")
 CHESSCOM_API_BASE = Config.get("CHESSCOM_API_BASE")
-REQUEST_DELAY = Config.get("REQUEST_DELAY")
-HEADERS = Config.get("HEADERS")
+FETCH_CONCURRENCY = Config.get("FETCH_CONCURRENCY")
+STAGING_MAX_ROWS = Config.get("STAGING_MAX_ROWS")
+MAX_URIS_PER_LOAD_JOB = Config.get("MAX_URIS_PER_LOAD_JOB")
+FIRESTORE_BATCH_SIZE = Config.get("FIRESTORE_BATCH_SIZE")
+AVATAR_UPLOAD_WORKERS = Config.get("AVATAR_UPLOAD_WORKERS")
 FIRESTORE_CHESSCOM_USERS_COLLECTION = Config.get("FIRESTORE_CHESSCOM_USERS_COLLECTION")
 LEADERBOARD_TYPES = ["live_bullet", "live_rapid", "daily", "live_blitz"]
+# Campi del documento del giocatore letti dallo staging delle partite
+GAMES_STATE_FIELDS = ["collected_days", "games_watermark", "games_complete_months", "games_checkpoint"]
+GAMES_START_DATE = datetime.date.fromisoformat(Config.get("GAMES_START_DATE"))
+METRICS_TEXTFILE_DIR = Config.get("METRICS_TEXTFILE_DIR")
+METRICS_PUSHGATEWAY_URL = Config.get("METRICS_PUSHGATEWAY_URL")
+LOCAL_GAME_STORE_DIR = Config.get("LOCAL_GAME_STORE_DIR")
+POSITION_INDEX_PATH = Config.get("POSITION_INDEX_PATH")
+POSITION_INDEX_MAX_PLY = Config.get("POSITION_INDEX_MAX_PLY")
 
 logger = Config.init_logging()
+metrics = get_metrics()
 
 class ChesscomDataCollector:
     """Gestisce la raccolta dati da Chess.com e il salvataggio su Firestore."""
     
-    def __init__(self, firestore_conn: Optional[FirestoreConnection] = None) -> None:
+    def __init__(self, firestore_conn: Optional[FirestoreConnection] = None,
+                 http_client: Optional[ChesscomHttpClient] = None,
+                 on_player_saved: Optional[Callable[[str], None]] = None) -> None:
         self.firestore_conn = firestore_conn or FirestoreConnection()
-        self.db = self.firestore_conn.db
-        self.bucket_avatar =  BucketManager(Config.get("BUCKET_NAME_AVATARS"))
-        self.bucket_upload_data = BucketManager(Config.get("BUCKET_UPLOAD_DATA"))
+        self.bucket_avatar =  BucketManager(Config.get("BUCKET_NAME_AVATARS"), Config.get("GCS_TRANSFER_WORKERS"))
+        self.bucket_upload_data = BucketManager(Config.get("BUCKET_UPLOAD_DATA"), Config.get("GCS_TRANSFER_WORKERS"))
+        self.http = http_client or get_http_client()
+        # Hook chiamato dopo ogni scrittura di un giocatore (es. invalidazione delle cache dell'API)
+        self.on_player_saved = on_player_saved
+        self.archive_cache = ArchiveCache(Config.get("ARCHIVE_CACHE_DIR"))
+        self.avatar_manifest = AvatarManifest()
+        self.local_store = self._open_local_store()
+        self.position_index = PositionIndex(POSITION_INDEX_PATH, POSITION_INDEX_MAX_PLY) if POSITION_INDEX_PATH else None
 
 
+    @property
+    def db(self) -> firestore.Client:
+        return self.firestore_conn.db
+
     def get_existing_players(self) -> List[str]:
-        """Ottiene gli username dei giocatori già presenti in Firestore."""
-        users_ref = self.db.collection(FIRESTORE_CHESSCOM_USERS_COLLECTION)
-        docs = users_ref.stream()
+        """
+        Ottiene gli username dei giocatori già presenti in Firestore.
+        Con la stessa lettura aggiorna il manifest degli avatar già salvati.
+        """
+        users_ref = self.db.collection(FIRESTORE_CHESSCOM_USERS_COLLECTION).select(AVATAR_FIELDS)
+        with metrics.timed("firestore", "list_players"):
+            docs = list(users_ref.stream())
+        self.avatar_manifest.load(docs)
         return [doc.id for doc in docs]
 
     def get_top_players_from_leaderboards(self) -> List[str]:
         """Recupera i top 50 giocatori da più leaderboard di Chess.com."""
         url = f"{CHESSCOM_API_BASE}/leaderboards"
         try:
-            response = requests.get(url, headers=HEADERS, timeout=10)
+            response = self.http.get(url, "leaderboards")
             response.raise_for_status()
             leaderboards = response.json()
 
@@ -63,7 +100,7 @@ class ChesscomDataCollector:
         """Recupera il profilo del giocatore da Chess.com."""
         url = f"{CHESSCOM_API_BASE}/player/{username}"
         try:
-            response = requests.get(url, headers=HEADERS, timeout=10)
+            response = self.http.get(url, "profile")
             status_code = response.status_code
 
             if status_code == 200:
@@ -78,7 +115,7 @@ class ChesscomDataCollector:
         """Recupera le statistiche del giocatore da Chess.com."""
         url = f"{CHESSCOM_API_BASE}/player/{username}/stats"
         try:
-            response = requests.get(url, headers=HEADERS, timeout=10)
+            response = self.http.get(url, "stats")
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -99,15 +136,19 @@ class ChesscomDataCollector:
             
             blob = self.bucket_avatar.get_blob(blob_name)
             
-            if not blob.exists():
+            with metrics.timed("gcs", "avatar_exists"):
+                exists = blob.exists()
+            if not exists:
                 try:
-                    response = requests.get(avatar_url, headers=HEADERS, timeout=10)
+                    response = self.http.get(avatar_url, "avatar", rate_limited=False)
                     response.raise_for_status()
                     
-                    blob.upload_from_string(
-                        response.content, 
-                        content_type=response.headers.get('content-type', 'image/jpeg')
-                    )
+                    with metrics.timed("gcs", "upload_avatar"):
+                        blob.upload_from_string(
+                            response.content, 
+                            content_type=response.headers.get('content-type', 'image/jpeg')
+                        )
+                    metrics.inc("chesscom_gcs_bytes_total", len(response.content), operation="upload_avatar")
                     logger.log_text(f"Avatar salvato per {username}", severity="INFO")
                     
                 except requests.exceptions.RequestException as e:
@@ -120,8 +161,13 @@ class ChesscomDataCollector:
             logger.log_text(f"Errore durante il salvataggio dell'avatar di {username}: {str(e)}", severity="ERROR")
             return None
 
-    def save_to_firestore(self, player_name: str, stats_data: Dict[str, Any], profile_data: Dict[str, Any], stored_avatar_url: Optional[str]) -> None:
-        """Salva i dati del giocatore in Firestore."""
+    def save_to_firestore(self, player_name: str, stats_data: Dict[str, Any], profile_data: Dict[str, Any], stored_avatar_url: Optional[str],
+                          writer: Optional[FirestoreBatchWriter] = None) -> Dict[str, Any]:
+        """
+        Salva i dati del giocatore in Firestore e ritorna i campi scritti,
+        con last_updated valorizzato al momento della scrittura.
+        Se viene passato un writer la scrittura viene accodata al suo batch.
+        """
         player_name = player_name.lower()
         doc_ref = self.db.collection(FIRESTORE_CHESSCOM_USERS_COLLECTION).document(player_name)
         timestamp = datetime.datetime.utcnow().isoformat()
@@ -164,172 +210,627 @@ class ChesscomDataCollector:
                 }
                 data_to_save[game_type] = {k: v for k, v in stats_fields.items() if v is not None}
 
-        doc_ref.set(data_to_save, merge=True)
+        if writer:
+            writer.set(doc_ref, data_to_save, merge=True)
+        else:
+            with metrics.timed("firestore", "save_player"):
+                doc_ref.set(data_to_save, merge=True)
         logger.log_text(f"Dati salvati per {player_name}", severity="INFO")
+        self._notify_player_saved(player_name)
+        return {**data_to_save, "last_updated": datetime.datetime.now(datetime.timezone.utc)}
 
-    def fetch_chess_data(self) -> None:
-        """Aggiorna i dati dei giocatori."""
+    def store_avatar(self, player_name: str, avatar_url: str) -> Optional[str]:
+        """Salva l'avatar nel bucket e aggiorna i relativi campi del documento del giocatore."""
+        stored_avatar_url = self.download_and_store_avatar(avatar_url, player_name)
+        if stored_avatar_url:
+            doc_ref = self.db.collection(FIRESTORE_CHESSCOM_USERS_COLLECTION).document(player_name.lower())
+            with metrics.timed("firestore", "save_avatar"):
+                doc_ref.set({
+                    "avatar_storage_url": stored_avatar_url,
+                    "original_avatar_url": avatar_url
+                }, merge=True)
+            self.avatar_manifest.record(player_name, avatar_url, stored_avatar_url)
+            self._notify_player_saved(player_name.lower())
+        return stored_avatar_url
+
+    def _notify_player_saved(self, player_name: str) -> None:
+        if self.on_player_saved:
+            self.on_player_saved(player_name)
+
+    def _get_all_players(self) -> List[str]:
         existing_players = self.get_existing_players()
         leaderboard_players = self.get_top_players_from_leaderboards()
-        all_players = list(set(existing_players + leaderboard_players))
+        return list(set(existing_players + leaderboard_players))
 
-        for player in all_players:
-            status, profile = self.get_player_profile(player)
-            if status != 200 or not profile:
-                continue
+    def refresh_player(self, player: str, writer: Optional[FirestoreBatchWriter] = None,
+                       uploader: Optional[AvatarUploader] = None) -> bool:
+        """
+        Scarica profilo, statistiche e avatar di un giocatore e li salva in Firestore.
+        Gli avatar invariati rispetto al manifest non vengono riscaricati; quelli nuovi,
+        se viene passato un uploader, vengono salvati in background.
+        """
+        status, profile = self.get_player_profile(player)
+        if status != 200 or not profile:
+            metrics.inc("chesscom_players_total", operation="refresh", result="error")
+            return False
+
+        stats_data = self.get_player_stats(player) or {}
+        avatar_url = profile.get("avatar")
+        stored_avatar_url = self.avatar_manifest.lookup(player, avatar_url) if avatar_url else None
+        if avatar_url and not stored_avatar_url:
+            if uploader:
+                uploader.submit(player, avatar_url)
+            else:
+                stored_avatar_url = self.download_and_store_avatar(avatar_url, player)
+        self.save_to_firestore(player, stats_data, profile, stored_avatar_url, writer=writer)
+        metrics.inc("chesscom_players_total", operation="refresh", result="ok")
+        return True
 
-            stats_data = self.get_player_stats(player) or {}
-            avatar_url = profile.get("avatar")
-            stored_avatar_url = self.download_and_store_avatar(avatar_url, player) if avatar_url else None
-            self.save_to_firestore(player, stats_data, profile, stored_avatar_url)
-            time.sleep(REQUEST_DELAY)
-        
-    def get_collected_days(self, player: str) -> List[str]:
-        """Ottiene i giorni già raccolti per un giocatore."""
+    def fetch_chess_data(self, concurrent: bool = False, concurrency: Optional[int] = None, batched: bool = False) -> None:
+        """
+        Aggiorna i dati dei giocatori.
+        Con concurrent=True i giocatori vengono aggiornati in parallelo (vedi fetch_chess_data_async).
+        Con batched=True le scritture su Firestore vengono raggruppate in batch (vedi FirestoreBatchWriter).
+        A fine aggiornamento vengono ricalcolate le classifiche precalcolate.
+        """
+        run_start, since = time.perf_counter(), metrics.snapshot()
+        writer = FirestoreBatchWriter(self.db, FIRESTORE_BATCH_SIZE) if batched else None
+        uploader = AvatarUploader(self.store_avatar, AVATAR_UPLOAD_WORKERS)
+
+        if concurrent:
+            asyncio.run(self.fetch_chess_data_async(concurrency, writer=writer, uploader=uploader))
+        else:
+            for player in self._get_all_players():
+                self.refresh_player(player, writer=writer, uploader=uploader)
+
+        if writer:
+            self._flush_writer(writer)
+        stored, failed = uploader.wait()
+        logger.log_text(f"Avatar salvati: {stored}, non salvati: {failed}.", severity="INFO")
+        self.update_leaderboard_snapshots()
+        self.report_run("fetch_chess_data", run_start, since)
+
+    @staticmethod
+    def report_run(run: str, start: float, since: Optional[Dict] = None) -> None:
+        """
+        Registra la durata del run, scrive nel log il riepilogo delle metriche
+        misurate dallo snapshot `since` ed esporta le metriche in formato Prometheus
+        (file per il textfile collector e/o Pushgateway, se configurati).
+        """
+        elapsed = time.perf_counter() - start
+        metrics.observe("chesscom_run_seconds", elapsed, run=run)
+        lines = metrics.summary(since)
+        logger.log_text(f"Riepilogo {run} ({elapsed:.1f}s):\n" + "\n".join(lines), severity="INFO")
+        print(f"📊 Riepilogo {run} ({elapsed:.1f}s):\n" + "\n".join(lines))
+
+        try:
+            if METRICS_TEXTFILE_DIR:
+                metrics.write_textfile(METRICS_TEXTFILE_DIR, run)
+            if METRICS_PUSHGATEWAY_URL:
+                metrics.push(METRICS_PUSHGATEWAY_URL, run)
+        except Exception as e:
+            logger.log_text(f"Errore nell'esportazione delle metriche di {run}: {str(e)}", severity="WARNING")
+
+    @staticmethod
+    def _flush_writer(writer: FirestoreBatchWriter) -> None:
+        with metrics.timed("firestore", "flush_batch"):
+            writer.flush()
+        for doc_path, error in writer.errors.items():
+            logger.log_text(f"Errore nella scrittura di {doc_path}: {error}", severity="ERROR")
+        logger.log_text(
+            f"Scritture Firestore completate: {writer.committed} ok, {len(writer.errors)} in errore.",
+            severity="ERROR" if writer.errors else "INFO"
+        )
+
+    def update_leaderboard_snapshots(self) -> None:
+        """Ricalcola le classifiche precalcolate servite da /top-players/."""
+        with metrics.timed("firestore", "save_leaderboard_snapshots"):
+            count = self.firestore_conn.save_leaderboard_snapshots()
+        logger.log_text(f"Salvate {count} classifiche precalcolate.", severity="INFO")
+
+    async def fetch_chess_data_async(self, concurrency: Optional[int] = None,
+                                     writer: Optional[FirestoreBatchWriter] = None,
+                                     uploader: Optional[AvatarUploader] = None) -> None:
+        """
+        Aggiorna i dati dei giocatori con al più `concurrency` giocatori in corso alla volta.
+        Il ritmo delle chiamate a Chess.com è regolato dal rate limiter condiviso.
+        """
+        semaphore = asyncio.Semaphore(concurrency or FETCH_CONCURRENCY)
+        all_players = await asyncio.to_thread(self._get_all_players)
+
+        async def refresh(player: str) -> bool:
+            async with semaphore:
+                try:
+                    return await asyncio.to_thread(self.refresh_player, player, writer, uploader)
+                except Exception as e:
+                    logger.log_text(f"Errore nell'aggiornamento di {player}: {str(e)}", severity="ERROR")
+                    return False
+
+        results = await asyncio.gather(*(refresh(player) for player in all_players))
+        logger.log_text(f"Aggiornati {sum(results)}/{len(all_players)} giocatori.", severity="INFO")
+
+    def get_games_state(self, player: str) -> Dict[str, Any]:
+        """
+        Legge con una sola richiesta i campi GAMES_STATE_FIELDS del documento del giocatore,
+        da passare a get_collected_days, get_games_watermark, get_complete_months e get_games_checkpoint.
+        """
         doc_ref = self.db.collection(FIRESTORE_CHESSCOM_USERS_COLLECTION).document(player)
-        doc = doc_ref.get()
-        return doc.to_dict().get("collected_days", []) if doc.exists else []
+        with metrics.timed("firestore", "get_games_state"):
+            doc = doc_ref.get(field_paths=GAMES_STATE_FIELDS)
+        return (doc.to_dict() or {}) if doc.exists else {}
+
+    @staticmethod
+    def get_collected_days(games_state: Dict[str, Any]) -> List[str]:
+        """Ottiene i giorni già raccolti per un giocatore."""
+        return games_state.get("collected_days") or []
 
-    def save_collected_days(self, player: str, days: List[str]) -> None:
+    def save_collected_days(self, player: str, days: List[str], watermark: Optional[float] = None,
+                            writer: Optional[FirestoreBatchWriter] = None, clear_checkpoint: bool = False,
+                            openings: Optional[opening_stats.Aggregates] = None,
+                            complete_months: Optional[List[str]] = None) -> None:
         if isinstance(days, set):
             days = list(days)
         doc_ref = self.db.collection(FIRESTORE_CHESSCOM_USERS_COLLECTION).document(player)
-        doc_ref.set({"collected_days": firestore.ArrayUnion(days)}, merge=True)
+        data = {"collected_days": firestore.ArrayUnion(days)}
+        if watermark is not None:
+            data["games_watermark"] = watermark
+        if clear_checkpoint:
+            # Nella stessa scrittura dei giorni: il checkpoint sparisce solo quando i dati sono caricati
+            data["games_checkpoint"] = firestore.DELETE_FIELD
+        if openings:
+            # Gli aggregati per apertura vengono incrementati insieme ai giorni, quindi una sola volta per partita
+            data["openings"] = opening_stats.as_increments(openings, firestore.Increment)
+        if complete_months:
+            # Sul documento del giocatore e non solo nella cache locale: lo staging può girare su un altro worker
+            data["games_complete_months"] = firestore.ArrayUnion(complete_months)
+        if writer:
+            writer.set(doc_ref, data, merge=True)
+        else:
+            with metrics.timed("firestore", "save_collected_days"):
+                doc_ref.set(data, merge=True)
+
+
+    def extract_moves_from_pgn(self, pgn: str, as_tokens: bool = False) -> Union[str, List[str]]:
+        """
+        Estrae le mosse SAN dal PGN di una partita.
+        Ritorna la stringa delle mosse separate da spazi oppure, con as_tokens=True, la lista delle mosse.
+        """
+        if as_tokens:
+            return pgn_tokenizer.tokenize_moves(pgn)
+        return pgn_tokenizer.extract_moves(pgn)
 
+    def _fetch_month_games(self, player: str, year: int, month: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Scarica l'archivio mensile delle partite con una richiesta condizionale.
+        Se Chess.com risponde 304 ritorna le partite salvate nella cache su disco.
+        """
+        url = f"{CHESSCOM_API_BASE}/player/{player}/games/{year}/{month:02d}"
+        cached = self.archive_cache.get(player, year, month)
+        headers = self.archive_cache.conditional_headers(cached)
 
-    def extract_moves_from_pgn(self, pgn: str) -> List[str]:
+        try:
+            response = self.http.get(url, "games", headers=headers)
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Errore nel recupero dati per {player} - {year}/{month:02d}: {str(e)}")
+            return None
 
-        move_lines = []
-        
-        for line in pgn.strip().split('\n'):
-            if re.match(r'^\d+\.', line):
-                move_lines.append(line)
-        
-        all_moves_text = ' '.join(move_lines)
-        
-        all_moves_text = re.sub(r'\{[^}]*\}', '', all_moves_text)
-        
-        all_moves_text = re.sub(r'\s(0-1|1-0|1\/2-1\/2)$', '', all_moves_text)
-        all_moves_text = re.sub(r'\s+', ' ', all_moves_text).strip()
-        
-        return all_moves_text
+        if response.status_code == 304 and cached is not None:
+            return cached.get("games", [])
 
+        if response.status_code != 200:
+            print(f"❌ Errore nel recupero dati per {player} - {year}/{month:02d}")
+            return None
 
-    def _save_game_to_csv(self, player: str, game_day: str, game_data: dict) -> None:
-        """Salva i dati di un giocatore in un CSV nel bucket senza sovrascrivere."""
-        game_id = game_data["game_id"]
-        local_csv_path = f"/tmp/{player}_{game_day}_{game_id}.csv"
-        gcs_csv_path = f"{player}/{game_day}/{game_id}.csv"
-        df = pd.DataFrame([game_data])
+        games = response.json().get("games", [])
+        self.archive_cache.put(
+            player, year, month, games,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified")
+        )
+        return games
 
-        # Se il file esiste già, scriviamo in modalità "append" (a)
-        write_mode = "a" if os.path.exists(local_csv_path) else "w"
-        header = not os.path.exists(local_csv_path)  # Scrive l'header solo se il file non esiste
+    def get_game_archives(self, player: str) -> Optional[List[Tuple[int, int]]]:
+        """
+        Ritorna i mesi (anno, mese) per cui esiste un archivio di partite del giocatore,
+        oppure None se l'elenco non è disponibile.
+        """
+        url = f"{CHESSCOM_API_BASE}/player/{player}/games/archives"
+        try:
+            response = self.http.get(url, "archives")
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.log_text(f"Errore nel recupero degli archivi di {player}: {str(e)}", severity="ERROR")
+            return None
 
-        df.to_csv(local_csv_path, index=False, encoding="utf-8", mode=write_mode, header=header)
+        months = []
+        for archive_url in response.json().get("archives", []):
+            year, month = archive_url.rstrip("/").split("/")[-2:]
+            months.append((int(year), int(month)))
+        return sorted(months)
+
+    @staticmethod
+    def get_games_watermark(games_state: Dict[str, Any]) -> Optional[float]:
+        """Ritorna l'end_time dell'ultima partita caricata per il giocatore."""
+        return games_state.get("games_watermark")
+
+    @staticmethod
+    def get_complete_months(games_state: Dict[str, Any]) -> List[str]:
+        """Ritorna i mesi chiusi ("YYYY-MM") già caricati completamente in BigQuery."""
+        return games_state.get("games_complete_months") or []
+
+    @staticmethod
+    def get_games_checkpoint(games_state: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Ritorna i mesi già scaricati e messi in staging da un run non ancora caricato in BigQuery."""
+        return games_state.get("games_checkpoint") or {}
+
+    def _build_game_data(self, player: str, game: Dict[str, Any], end_time: datetime.datetime) -> Dict[str, Any]:
+        return {
+            "game_id": game["url"].split("/")[-1],
+            "user_id": player,
+            "white_player": game.get("white", {}).get("username"),
+            "black_player": game.get("black", {}).get("username"),
+            "rating_white": game.get("white", {}).get("rating"),
+            "rating_black": game.get("black", {}).get("rating"),
+            "result_white": game.get("white", {}).get("result"),
+            "result_black": game.get("black", {}).get("result"),
+            "accuracy_white": game.get("accuracies", {}).get("white", 0.0),
+            "accuracy_black": game.get("accuracies", {}).get("black", 0.0),
+            "time_control": game["time_control"],
+            "time_class": game.get("time_class"),
+            "end_time": end_time.timestamp(),
+            "moves": self.extract_moves_from_pgn(game["pgn"]),
+            "eco": game.get("eco"),
+            "url": game["url"]
+        }
 
-        self.bucket_upload_data.upload_file(local_csv_path, gcs_csv_path)
-        os.remove(local_csv_path)
-        
-    def fetch_and_store_games(self, players: List[str]) -> None:
-        """Recupera le partite giorno per giorno e carica i dati in BigQuery giocatore per giocatore."""
-        
-        yesterday = datetime.date.today() - datetime.timedelta(days=1)
-        yesterday_year = yesterday.year
-        yesterday_month = yesterday.month
+    def _stage_all_months(self, player: str, yesterday: datetime.date, progress: Dict[str, Any],
+                          games_state: Dict[str, Any]) -> bool:
+        """
+        Analizza tutti i mesi da GAMES_START_DATE a ieri, saltando i giorni già raccolti.
+        Ritorna False se il download di un mese fallisce.
+        """
         yesterday_str = yesterday.strftime("%Y-%m-%d")
+        collected_days = set(self.get_collected_days(games_state))
+        checkpoint = self.get_games_checkpoint(games_state)
+
+        for year in range(GAMES_START_DATE.year, yesterday.year + 1):  # 🔹 Non superiamo l'anno di ieri
+            for month in range(1, 13):
+                # 🔹 Se il mese è successivo a ieri nell'anno corrente, interrompiamo il ciclo
+                if year == yesterday.year and month > yesterday.month:
+                    break
+                if (year, month) < (GAMES_START_DATE.year, GAMES_START_DATE.month):
+                    continue
+
+                # 🔹 I mesi chiusi e già caricati non cambiano più
+                if self.archive_cache.is_complete(player, year, month):
+                    continue
+                if self._resume_month(player, year, month, yesterday, checkpoint, progress):
+                    continue
+
+                games = self._fetch_month_games(player, year, month)
+                if games is None:
+                    return False
+
+                month_progress = self._new_progress()
+                writer = self._month_writer(player, year, month)
+                try:
+                    for game in games:
+                        end_time = datetime.datetime.utcfromtimestamp(game["end_time"])
+                        game_day = end_time.strftime("%Y-%m-%d")
 
-        for player in players:
-            print(f"🔄 Analizzando {player}...")
+                        if game_day >= yesterday_str or game_day in collected_days:
+                            continue
 
-            self.bucket_upload_data.delete_files_under_path(player)
-            collected_days = self.get_collected_days(player)
-            processed_days = set()
+                        self._stage_game(player, game, end_time, writer, month_progress)
+                    self._checkpoint_month(player, year, month, yesterday, writer, month_progress, progress)
+                finally:
+                    writer.discard()
+        return True
 
-            for year in range(2025, yesterday_year + 1):  # 🔹 Non superiamo l'anno di ieri
-                for month in range(1, 13):
-                    # 🔹 Se il mese è successivo a ieri nell'anno corrente, interrompiamo il ciclo
-                    if year == yesterday_year and month > yesterday_month:
-                        break
+    def _stage_new_months(self, player: str, yesterday: datetime.date, progress: Dict[str, Any],
+                          games_state: Dict[str, Any]) -> bool:
+        """
+        Modalità incrementale: scorre solo i mesi elencati da /games/archives,
+        dal più recente al più vecchio, e si ferma alla prima partita
+        non più recente del watermark del giocatore.
+        Ritorna False se il download dell'elenco degli archivi o di un mese fallisce.
+        """
+        yesterday_str = yesterday.strftime("%Y-%m-%d")
+        watermark = self.get_games_watermark(games_state)
+        checkpoint = self.get_games_checkpoint(games_state)
+        if watermark is None:
+            watermark = datetime.datetime.combine(GAMES_START_DATE, datetime.time(), tzinfo=datetime.timezone.utc).timestamp()
+        watermark_month = datetime.datetime.utcfromtimestamp(watermark)
+        first_month = (watermark_month.year, watermark_month.month)
+        last_month = (yesterday.year, yesterday.month)
+
+        archives = self.get_game_archives(player)
+        if archives is None:
+            # Un elenco vuoto verrebbe scambiato per "nessuna nuova partita" e cancellerebbe il checkpoint
+            return False
+        months = [m for m in archives if first_month <= m <= last_month]
+
+        for year, month in reversed(months):
+            if self.archive_cache.is_complete(player, year, month):
+                continue
+            # Il watermark cade solo nel mese più vecchio dell'elenco: un mese ripreso dal checkpoint non interrompe il ciclo
+            if self._resume_month(player, year, month, yesterday, checkpoint, progress):
+                continue
 
-                    url = f"https://api.chess.com/pub/player/{player}/games/{year}/{month:02d}"
-                    response = requests.get(url, headers=HEADERS, timeout=10)
+            games = self._fetch_month_games(player, year, month)
+            if games is None:
+                return False
+
+            month_progress = self._new_progress()
+            writer = self._month_writer(player, year, month)
+            reached_watermark = False
+            try:
+                for game in reversed(games):
+                    if game["end_time"] <= watermark:
+                        reached_watermark = True
+                        break
 
-                    if response.status_code != 200:
-                        print(f"❌ Errore nel recupero dati per {player} - {year}/{month:02d}")
+                    end_time = datetime.datetime.utcfromtimestamp(game["end_time"])
+                    if end_time.strftime("%Y-%m-%d") >= yesterday_str:
                         continue
 
-                    games = response.json().get("games", [])
+                    self._stage_game(player, game, end_time, writer, month_progress)
+                self._checkpoint_month(player, year, month, yesterday, writer, month_progress, progress)
+            finally:
+                writer.discard()
 
-                    for game in games:
-                        end_time = datetime.datetime.utcfromtimestamp(game["end_time"])
-                        game_day = end_time.strftime("%Y-%m-%d")
+            if reached_watermark:
+                break
+        return True
 
-                        if game_day >= yesterday_str:
-                            continue
+    @staticmethod
+    def _new_progress() -> Dict[str, Any]:
+        return {"days": set(), "watermark": None, "closed_months": [], "files": [], "openings": {}}
 
-                        if game_day in collected_days:
-                            continue
+    def _month_writer(self, player: str, year: int, month: int) -> GameStagingWriter:
+        # Percorso deterministico: ripetere lo staging di un mese sovrascrive i suoi file
+        return GameStagingWriter(self.bucket_upload_data, f"{player}/{year}-{month:02d}", max_rows=STAGING_MAX_ROWS,
+                                 local_store=self.local_store, position_index=self.position_index)
+
+    @staticmethod
+    def _open_local_store() -> Optional[local_game_store.LocalGameStore]:
+        """Archivio Parquet locale, se configurato e se duckdb è installato."""
+        if not LOCAL_GAME_STORE_DIR:
+            return None
+        if not local_game_store.is_available():
+            logger.log_text("LOCAL_GAME_STORE_DIR è configurato ma duckdb non è installato: archivio locale disattivato.", severity="WARNING")
+            return None
+        return local_game_store.LocalGameStore(LOCAL_GAME_STORE_DIR)
+
+    @staticmethod
+    def _is_closed_month(year: int, month: int, yesterday: datetime.date) -> bool:
+        next_month = datetime.date(year + month // 12, month % 12 + 1, 1)
+        return next_month <= yesterday
+
+    def _checkpoint_month(self, player: str, year: int, month: int, yesterday: datetime.date,
+                          writer: GameStagingWriter, month_progress: Dict[str, Any], progress: Dict[str, Any]) -> None:
+        """
+        Chiude i file di staging del mese, li carica in parallelo nel bucket e registra subito
+        il mese nel checkpoint del giocatore, così un run interrotto riparte dal primo mese mancante.
+        """
+        entry = {
+            "files": writer.close(),
+            "days": sorted(month_progress["days"]),
+            "watermark": month_progress["watermark"],
+            "closed": self._is_closed_month(year, month, yesterday),
+            "staged_until": yesterday.isoformat(),
+            "openings": month_progress["openings"],
+        }
+        doc_ref = self.db.collection(FIRESTORE_CHESSCOM_USERS_COLLECTION).document(player)
+        with metrics.timed("firestore", "save_checkpoint"):
+            doc_ref.set({"games_checkpoint": {f"{year}-{month:02d}": entry}}, merge=True)
+        self._merge_month(year, month, entry, progress)
+
+    def _resume_month(self, player: str, year: int, month: int, yesterday: datetime.date,
+                      checkpoint: Dict[str, Dict[str, Any]], progress: Dict[str, Any]) -> bool:
+        """
+        Riprende un mese dal checkpoint se i suoi file di staging sono ancora validi:
+        i mesi chiusi sempre, il mese in corso solo se preparato per lo stesso giorno.
+        """
+        entry = checkpoint.get(f"{year}-{month:02d}")
+        if not entry or not (entry.get("closed") or entry.get("staged_until") == yesterday.isoformat()):
+            return False
+        print(f"⏩ {player} - {year}/{month:02d} ripreso dal checkpoint")
+        self._merge_month(year, month, entry, progress)
+        return True
+
+    @staticmethod
+    def _merge_month(year: int, month: int, entry: Dict[str, Any], progress: Dict[str, Any]) -> None:
+        progress["files"].extend(entry["files"])
+        progress["days"].update(entry["days"])
+        if entry["watermark"] is not None:
+            progress["watermark"] = max(progress["watermark"] or 0, entry["watermark"])
+        if entry["closed"]:
+            progress["closed_months"].append((year, month))
+        opening_stats.merge(progress["openings"], entry.get("openings") or {})
+
+    def _stage_game(self, player: str, game: Dict[str, Any], end_time: datetime.datetime,
+                    writer: GameStagingWriter, progress: Dict[str, Any]) -> None:
+        # Le partite che non partono dalla posizione standard (Chess960) non si possono rigiocare
+        writer.add(self._build_game_data(player, game, end_time), index_positions=game.get("rules", "chess") == "chess")
+        progress["days"].add(end_time.strftime("%Y-%m-%d"))
+        progress["watermark"] = max(progress["watermark"] or 0, game["end_time"])
+        opening_stats.add_game(progress["openings"], player, game)
+
+    def _discard_unreferenced_files(self, player: str, checkpoint: Dict[str, Dict[str, Any]]) -> None:
+        """Elimina i file di staging del giocatore che non appartengono a un mese del checkpoint."""
+        referenced = {blob for entry in checkpoint.values() for blob in entry.get("files", [])}
+        with metrics.timed("gcs", "list_staging"):
+            stale = [blob for blob in self.bucket_upload_data.list_files(prefix=f"{player}/") if blob not in referenced]
+        if stale:
+            with metrics.timed("gcs", "delete_staging"):
+                self.bucket_upload_data.delete_blobs(stale, operation="delete_staging")
+
+    def _clear_checkpoint(self, player: str) -> None:
+        doc_ref = self.db.collection(FIRESTORE_CHESSCOM_USERS_COLLECTION).document(player)
+        with metrics.timed("firestore", "clear_checkpoint"):
+            doc_ref.set({"games_checkpoint": firestore.DELETE_FIELD}, merge=True)
+
+    def stage_player_games(self, player: str, yesterday: datetime.date, incremental: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Scarica le nuove partite di un giocatore e le scrive nei file di staging, un gruppo di file per mese.
+        Ogni mese completato viene registrato nel checkpoint del giocatore: dopo un'interruzione
+        il run successivo riusa i file già preparati e riparte dal primo mese mancante.
+        Ritorna lo stato da salvare dopo il caricamento in BigQuery (giorni, watermark,
+        mesi chiusi e file), serializzabile in JSON, oppure None se non ci sono nuove partite
+        o se il download degli archivi o di un mese non è riuscito.
+        """
+        print(f"🔄 Analizzando {player}...")
+
+        # Una sola lettura del documento del giocatore per checkpoint, watermark, giorni e mesi completi
+        games_state = self.get_games_state(player)
+        self._discard_unreferenced_files(player, self.get_games_checkpoint(games_state))
+        self._sync_complete_months(player, games_state)
+        progress = self._new_progress()
+
+        if incremental:
+            staged = self._stage_new_months(player, yesterday, progress, games_state)
+        else:
+            staged = self._stage_all_months(player, yesterday, progress, games_state)
+
+        if not staged:
+            # Salvare il watermark dei mesi più recenti renderebbe il mese fallito irraggiungibile:
+            # il giocatore viene saltato e i mesi già preparati restano nel checkpoint per il run successivo
+            print(f"⚠️ Download non riuscito per {player}: partite non salvate in questo run")
+            metrics.inc("chesscom_players_total", operation="stage_games", result="fetch_failed")
+            return None
 
-                        game_data = {
-                            "game_id": game["url"].split("/")[-1],
-                            "user_id": player,
-                            "white_player": game.get("white", {}).get("username"),
-                            "black_player": game.get("black", {}).get("username"),
-                            "rating_white": game.get("white", {}).get("rating"),
-                            "rating_black": game.get("black", {}).get("rating"),
-                            "result_white": game.get("white", {}).get("result"),  
-                            "result_black": game.get("black", {}).get("result"),
-                            "accuracy_white": game.get("accuracies", {}).get("white", 0.0),
-                            "accuracy_black": game.get("accuracies", {}).get("black", 0.0),
-                            "time_control": game["time_control"],
-                            "time_class": game.get("time_class"),
-                            "end_time": end_time.timestamp(),
-                            "moves": self.extract_moves_from_pgn(game["pgn"]),
-                            "eco": game.get("eco"),
-                            "url": game["url"]
-                        }
-
-                        self._save_game_to_csv(player, game_day, game_data)
-                        processed_days.add(game_day)
-
-                    time.sleep(REQUEST_DELAY)
-
-            success = self._upload_to_gcs_and_bigquery(player)
-
-            if success:
-                self.save_collected_days(player, processed_days)
-                print(f"✅ Giorni caricati su Firestore per {player}: {processed_days}")
+        if not progress["days"]:
+            print(f"✅ Nessuna nuova partita per {player}")
+            self._mark_months_complete(player, progress)
+            self._clear_checkpoint(player)
+            metrics.inc("chesscom_players_total", operation="stage_games", result="no_games")
+            return None
+
+        metrics.inc("chesscom_players_total", operation="stage_games", result="new_games")
+
+        progress["days"] = sorted(progress["days"])
+        return progress
+
+    def stage_games(self, players: List[str], incremental: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Esegue lo staging delle partite di più giocatori; ritorna lo stato dei giocatori con nuove partite."""
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        staged = {}
+        for player in players:
+            progress = self.stage_player_games(player, yesterday, incremental)
+            if progress:
+                staged[player] = progress
+        return staged
+
+    def commit_staged_games(self, staged: Dict[str, Dict[str, Any]]) -> List[str]:
+        """
+        Carica in BigQuery i file di staging e poi salva in Firestore giorni e watermark
+        dei giocatori caricati. Ritorna i giocatori caricati.
+        """
+        if not staged:
+            return []
+
+        loaded_players = self.load_staged_games({player: p["files"] for player, p in staged.items()})
+
+        # Giorni e watermark di tutti i giocatori caricati vengono scritti in pochi batch
+        writer = FirestoreBatchWriter(self.db, FIRESTORE_BATCH_SIZE)
+        for player, progress in staged.items():
+            if player in loaded_players:
+                self.save_collected_days(player, progress["days"], watermark=progress["watermark"],
+                                         writer=writer, clear_checkpoint=True, openings=progress.get("openings"),
+                                         complete_months=[f"{year}-{month:02d}" for year, month in progress["closed_months"]])
             else:
-                print(f"❌ Errore nell'upload su BigQuery per {player}. Giorni non salvati in Firestore.")
-    
-    def _upload_to_gcs_and_bigquery(self, player: str) -> None:
+                print(f"❌ Errore nell'upload su BigQuery per {player}. Giorni non salvati in Firestore, checkpoint mantenuto.")
+        self._flush_writer(writer)
+
+        committed = []
+        for player in loaded_players:
+            if f"{FIRESTORE_CHESSCOM_USERS_COLLECTION}/{player}" in writer.errors:
+                continue
+            self._mark_months_complete(player, staged[player])
+            committed.append(player)
+            print(f"✅ Giorni caricati su Firestore per {player}: {staged[player]['days']}")
+        return committed
 
-        BQ_DATASET= Config.get("BQ_DATASET_CHESSCOM")
+    def fetch_and_store_games(self, players: List[str], incremental: bool = False) -> None:
+        """
+        Recupera le partite giorno per giorno di tutti i giocatori e le carica in BigQuery
+        con un unico caricamento a fine run.
+        Con incremental=True vengono richiesti solo i mesi esistenti successivi al watermark del giocatore.
+        """
+        run_start, since = time.perf_counter(), metrics.snapshot()
+        self.commit_staged_games(self.stage_games(players, incremental))
+        self.report_run("fetch_and_store_games", run_start, since)
+
+    def _mark_months_complete(self, player: str, progress: Dict[str, Any]) -> None:
+        """Segna come completi i mesi chiusi analizzati, dopo il caricamento in BigQuery."""
+        for year, month in progress["closed_months"]:
+            self.archive_cache.mark_complete(player, year, month)
+
+    def _sync_complete_months(self, player: str, games_state: Dict[str, Any]) -> None:
+        """
+        Riporta nella cache locale i mesi completi salvati su Firestore. Con lo staging
+        diviso in shard il caricamento gira su un altro worker, la cui cache non contiene
+        i mesi scaricati: senza questo passaggio verrebbero richiesti a ogni run.
+        """
+        for key in self.get_complete_months(games_state):
+            year, month = key.split("-")
+            self.archive_cache.mark_complete(player, int(year), int(month))
+
+    def load_staged_games(self, staged_files: Dict[str, List[str]]) -> List[str]:
+        """
+        Carica in BigQuery i file di staging di tutti i giocatori.
+        I file vengono raggruppati in pochi load job (al più MAX_URIS_PER_LOAD_JOB file ciascuno)
+        avviati in parallelo. Ritorna i giocatori i cui dati sono stati caricati.
+        """
+        BQ_DATASET = Config.get("BQ_DATASET_CHESSCOM")
         BQ_TABLE = "chess_games"
-        
-        blobs = self.bucket_upload_data.list_files(prefix=f"{player}/")
-        
-        gcs_uris = [self.bucket_upload_data.get_blob_uri(blob) for blob in blobs]
+
+        batches = []
+        batch_players, batch_uris = [], []
+        for player, files in staged_files.items():
+            uris = [self.bucket_upload_data.get_blob_uri(blob) for blob in files]
+            if batch_uris and len(batch_uris) + len(uris) > MAX_URIS_PER_LOAD_JOB:
+                batches.append((batch_players, batch_uris))
+                batch_players, batch_uris = [], []
+            batch_players.append(player)
+            batch_uris.extend(uris)
+        if batch_uris:
+            batches.append((batch_players, batch_uris))
 
         # Creazione connessione a BigQuery
         bq_conn = BigQueryConnection()
 
         job_config = bigquery.LoadJobConfig(
-            source_format=bigquery.SourceFormat.CSV,
-            skip_leading_rows=1
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+            time_partitioning=bigquery.TimePartitioning(
+                type_=bigquery.TimePartitioningType.DAY,
+                field="end_time"
+            ),
+            clustering_fields=["user_id", "time_class"]
         )
 
-        try:
-            load_job = bq_conn.connection.load_table_from_uri(
-                gcs_uris,
-                f"{PROJECT}.{BQ_DATASET}.{BQ_TABLE}",
-                job_config=job_config
-            )
-            load_job.result()  # Attende il completamento del job
-            print(f"✅ Dati caricati in BigQuery per {player}")
-            return True
-
-        except Exception as e:
-            print(f"❌ Errore durante il caricamento su BigQuery: {str(e)}")
-            raise e
\ No newline at end of file
+        # I job vengono avviati tutti insieme e attesi solo alla fine
+        jobs = []
+        for batch_players, batch_uris in batches:
+            with metrics.timed("bigquery", "submit_load_job"):
+                load_job = bq_conn.connection.load_table_from_uri(
+                    batch_uris,
+                    f"{PROJECT}.{BQ_DATASET}.{BQ_TABLE}",
+                    job_config=job_config
+                )
+            jobs.append((batch_players, load_job))
+
+        loaded_players = []
+        for batch_players, load_job in jobs:
+            try:
+                with metrics.timed("bigquery", "wait_load_job"):
+                    load_job.result()  # Attende il completamento del job
+                metrics.inc("chesscom_rows_loaded_total", load_job.output_rows or 0, table=BQ_TABLE)
+                loaded_players.extend(batch_players)
+                print(f"✅ Dati caricati in BigQuery per {len(batch_players)} giocatori (job {load_job.job_id})")
+            except Exception as e:
+                print(f"❌ Errore durante il caricamento su BigQuery (job {load_job.job_id}): {str(e)}")
+
+        return loaded_players
@@ -0,0 +1,93 @@
+import datetime
+from typing import Any, Dict, List, Optional
+
+PLAYERS_HISTORY_TABLE = "chess-data-451709.chesscom.players_history"
+
+
+def _as_number(value: Any) -> float:
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time()).timestamp()
+    return float(value or 0)
+
+
+def lttb(rows: List[Dict[str, Any]], threshold: int, x_key: str, y_key: str) -> List[Dict[str, Any]]:
+    """
+    Riduce una serie ordinata per x_key a `threshold` punti con l'algoritmo
+    Largest-Triangle-Three-Buckets, che conserva la forma del grafico
+    (picchi e minimi) meglio di un campionamento uniforme.
+    Il primo e l'ultimo punto vengono sempre mantenuti.
+    """
+    if threshold >= len(rows):
+        return rows
+    if threshold < 3:
+        return [rows[0], rows[-1]][:max(threshold, 1)]
+
+    xs = [_as_number(row[x_key]) for row in rows]
+    ys = [_as_number(row[y_key]) for row in rows]
+
+    sampled = [rows[0]]
+    bucket_size = (len(rows) - 2) / (threshold - 2)
+    a = 0  # indice del punto scelto nel bucket precedente
+
+    for i in range(threshold - 2):
+        bucket_start = int(i * bucket_size) + 1
+        bucket_end = int((i + 1) * bucket_size) + 1
+
+        # Media del bucket successivo, usata come terzo vertice del triangolo
+        next_start = bucket_end
+        next_end = min(int((i + 2) * bucket_size) + 1, len(rows))
+        next_count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / next_count
+        avg_y = sum(ys[next_start:next_end]) / next_count
+
+        best_index, best_area = bucket_start, -1.0
+        for j in range(bucket_start, bucket_end):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best_index, best_area = j, area
+
+        sampled.append(rows[best_index])
+        a = best_index
+
+    sampled.append(rows[-1])
+    return sampled
+
+
+def player_history_sql(truncate_unit: Optional[str] = None) -> str:
+    """
+    Query dello storico di un giocatore (parametri @player_name, @game_type, @start_date).
+    Con truncate_unit (unità di TIMESTAMP_TRUNC, es. DAY) ritorna un punto per periodo:
+    l'ultimo snapshot del periodo, perché rating e W/L/D sono valori cumulativi,
+    con timestamp uguale all'inizio del periodo.
+    """
+    if truncate_unit is None:
+        return f"""
+            SELECT player_name, game_type, last_rating, best_rating,
+                   best_game_url, win, loss, draw, timestamp
+            FROM `{PLAYERS_HISTORY_TABLE}`
+            WHERE player_name = @player_name
+            AND game_type = @game_type
+            AND timestamp >= TIMESTAMP(@start_date)
+            ORDER BY timestamp ASC
+        """
+    # Il periodo ha un nome diverso da timestamp: la finestra ordina per il timestamp originale
+    return f"""
+        SELECT player_name, game_type, last_rating, best_rating,
+               best_game_url, win, loss, draw, period AS timestamp
+        FROM (
+            SELECT player_name, game_type, last_rating, best_rating,
+                   best_game_url, win, loss, draw,
+                   TIMESTAMP_TRUNC(timestamp, {truncate_unit}) AS period
+            FROM `{PLAYERS_HISTORY_TABLE}`
+            WHERE player_name = @player_name
+            AND game_type = @game_type
+            AND timestamp >= TIMESTAMP(@start_date)
+            QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY TIMESTAMP_TRUNC(timestamp, {truncate_unit})
+                ORDER BY timestamp DESC
+            ) = 1
+        )
+        ORDER BY period ASC
+    """
@@ -0,0 +1,63 @@
+import threading
+from typing import Any, Dict, List, Tuple, Union
+
+
+class FirestoreBatchWriter:
+    """
+    Raggruppa le scritture Firestore in WriteBatch da al più `max_batch_size`
+    operazioni, committate automaticamente quando il batch è pieno.
+    Se un commit fallisce le sue scritture vengono ritentate una per una,
+    così l'errore viene attribuito al singolo documento.
+    """
+
+    def __init__(self, db, max_batch_size: int = 500) -> None:
+        self.db = db
+        self.max_batch_size = max_batch_size
+        self._pending: List[Tuple[Any, Dict[str, Any], Union[bool, List[str]]]] = []
+        self._lock = threading.Lock()
+        self.committed = 0
+        self.errors: Dict[str, str] = {}
+
+    def set(self, doc_ref, data: Dict[str, Any], merge: Union[bool, List[str]] = False) -> None:
+        """Accoda una set(); il batch viene committato appena raggiunge max_batch_size operazioni."""
+        with self._lock:
+            self._pending.append((doc_ref, data, merge))
+            if len(self._pending) < self.max_batch_size:
+                return
+            pending, self._pending = self._pending, []
+        self._commit(pending)
+
+    def flush(self) -> None:
+        """Committa le scritture ancora in coda."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if pending:
+            self._commit(pending)
+
+    def _commit(self, pending: List[Tuple[Any, Dict[str, Any], Union[bool, List[str]]]]) -> None:
+        batch = self.db.batch()
+        for doc_ref, data, merge in pending:
+            batch.set(doc_ref, data, merge=merge)
+        try:
+            batch.commit()
+            with self._lock:
+                self.committed += len(pending)
+            return
+        except Exception:
+            pass
+
+        # Il batch è atomico: lo ripetiamo documento per documento per isolare gli errori
+        for doc_ref, data, merge in pending:
+            try:
+                doc_ref.set(data, merge=merge)
+                with self._lock:
+                    self.committed += 1
+            except Exception as e:
+                with self._lock:
+                    self.errors[doc_ref.path] = str(e)
+
+    def __enter__(self) -> "FirestoreBatchWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.flush()
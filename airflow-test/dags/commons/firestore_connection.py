@@ -1,17 +1,22 @@
 # firestore_connection.py
 
-import firebase_admin
-from firebase_admin import credentials, firestore
-import os
-class FirestoreConnection:
-    def __init__(self):
-        BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # Ottiene la directory del file corrente
-        CREDENTIALS_PATH = os.path.join(BASE_DIR,  "be_credentials.json")
+import heapq
+from google.cloud import firestore
+from commons.client_registry import get_firestore_client
+from commons.Config import Config
+
+LEADERBOARDS_COLLECTION = Config.get("FIRESTORE_LEADERBOARDS_COLLECTION")
+PIPELINE_STATE_COLLECTION = Config.get("FIRESTORE_PIPELINE_STATE_COLLECTION")
+GAME_TYPES = Config.get("GAME_TYPES")
+# Campi aggiornati a ogni scrittura di un giocatore: profilo e statistiche, partite caricate, avatar
+PLAYER_GENERATION_FIELDS = ["last_updated", "games_watermark", "avatar_storage_url"]
+LEADERBOARD_SNAPSHOT_SIZE = Config.get("LEADERBOARD_SNAPSHOT_SIZE")
 
-        if not firebase_admin._apps:
-            cred = credentials.Certificate(CREDENTIALS_PATH)
-            firebase_admin.initialize_app(cred)
-        self.db = firestore.client()
+class FirestoreConnection:
+    @property
+    def db(self):
+        # Il client Firestore è condiviso da tutto il processo e ricreato dopo un fork
+        return get_firestore_client()
 
     def get_user_data(self, username: str):
         """
@@ -25,11 +30,46 @@ class FirestoreConnection:
             return doc.to_dict()
         return None
 
+    def get_player_openings(self, username: str):
+        """
+        Ritorna gli aggregati per apertura e colore di un giocatore (campo openings),
+        leggendo solo quel campo del documento. Se il giocatore non esiste ritorna None.
+        """
+        doc = self.db.collection("chesscom_users").document(username.lower()).get(field_paths=["openings"])
+        if not doc.exists:
+            return None
+        return doc.to_dict().get("openings") or {}
+
+    def get_player_generation(self, username: str) -> tuple:
+        """
+        Ritorna la versione del documento di un giocatore: i valori di PLAYER_GENERATION_FIELDS,
+        che cambiano a ogni scrittura del collector, anche da un altro processo.
+        Se il giocatore non esiste ritorna una tupla vuota.
+        """
+        doc = self.db.collection("chesscom_users").document(username.lower()).get(field_paths=PLAYER_GENERATION_FIELDS)
+        if not doc.exists:
+            return ()
+        data = doc.to_dict()
+        return tuple(data.get(field) for field in PLAYER_GENERATION_FIELDS)
+
+    def get_pipeline_state(self, name: str):
+        """Ritorna lo stato salvato da una pipeline (es. ultima esecuzione), oppure None."""
+        doc = self.db.collection(PIPELINE_STATE_COLLECTION).document(name).get()
+        return doc.to_dict() if doc.exists else None
+
     def get_top_players(self, game_type: str, title: str = None, limit: int = 100):
         """
-        Esegue una query su Firestore e ritorna i top player (ordinati per actual_rating 
-        decrescente) per un certo game_type, filtrando eventualmente anche su title.
+        Ritorna i top player (ordinati per actual_rating decrescente) per un certo game_type,
+        filtrando eventualmente anche su title. Usa la classifica precalcolata dal collector
+        e, se manca o è troppo corta per il limit richiesto, esegue la query su Firestore.
         """
+        snapshot = self.get_leaderboard_snapshot(game_type, title)
+        if snapshot is not None:
+            rows = snapshot.get("rows", [])
+            # Una classifica più corta della dimensione massima contiene già tutti i giocatori
+            if limit <= len(rows) or len(rows) < snapshot.get("size", LEADERBOARD_SNAPSHOT_SIZE):
+                return rows[:limit]
+
         # Costruisci la query di base
         query = self.db.collection("chesscom_users")
 
@@ -45,17 +85,70 @@ class FirestoreConnection:
             data = doc.to_dict()
 
             if game_type in data:
-                avatar_gs_url = data.get("avatar_storage_url")
-                avatar_url = None
-                if avatar_gs_url:
-                    avatar_url = avatar_gs_url.replace("gs://", "https://storage.googleapis.com/")
-                results.append({
-                    "username": doc.id,
-                    "last_rating": data[game_type].get("last_rating", None),
-                    "name": data.get("name", None),
-                    "win": data[game_type].get("win", None),
-                    "loss": data[game_type].get("loss", None),
-                    "draw": data[game_type].get("draw", None),
-                    "avatar_url": avatar_url
-                })
-        return results
\ No newline at end of file
+                results.append(self._to_top_player_row(doc.id, data, game_type))
+        return results
+
+    @staticmethod
+    def _to_top_player_row(username: str, data: dict, game_type: str) -> dict:
+        avatar_gs_url = data.get("avatar_storage_url")
+        avatar_url = None
+        if avatar_gs_url:
+            avatar_url = avatar_gs_url.replace("gs://", "https://storage.googleapis.com/")
+        return {
+            "username": username,
+            "last_rating": data[game_type].get("last_rating", None),
+            "name": data.get("name", None),
+            "win": data[game_type].get("win", None),
+            "loss": data[game_type].get("loss", None),
+            "draw": data[game_type].get("draw", None),
+            "avatar_url": avatar_url
+        }
+
+    @staticmethod
+    def _leaderboard_snapshot_id(game_type: str, title: str = None) -> str:
+        return f"{game_type}__{title or 'ALL'}"
+
+    def get_leaderboard_snapshot(self, game_type: str, title: str = None):
+        """Ritorna la classifica precalcolata per game_type e title, oppure None."""
+        doc_id = self._leaderboard_snapshot_id(game_type, title)
+        doc = self.db.collection(LEADERBOARDS_COLLECTION).document(doc_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def save_leaderboard_snapshots(self, size: int = None) -> int:
+        """
+        Calcola e salva una classifica compatta (top `size` righe) per ogni game_type
+        e per ogni title, più quella senza filtro sul title. Legge solo i campi
+        necessari dei giocatori (niente collected_days). Ritorna il numero di classifiche salvate.
+        """
+        size = size or LEADERBOARD_SNAPSHOT_SIZE
+        fields = ["name", "title", "avatar_storage_url"] + GAME_TYPES
+        docs = self.db.collection("chesscom_users").select(fields).stream()
+
+        rankings = {}
+        for doc in docs:
+            data = doc.to_dict()
+            for game_type in GAME_TYPES:
+                stats = data.get(game_type)
+                if not isinstance(stats, dict) or stats.get("last_rating") is None:
+                    continue
+                row = self._to_top_player_row(doc.id, data, game_type)
+                for title in {None, data.get("title")}:
+                    rankings.setdefault((game_type, title), []).append(row)
+
+        batch = self.db.batch()
+        for count, ((game_type, title), rows) in enumerate(rankings.items(), start=1):
+            top_rows = heapq.nlargest(size, rows, key=lambda row: row["last_rating"])
+            doc_ref = self.db.collection(LEADERBOARDS_COLLECTION).document(self._leaderboard_snapshot_id(game_type, title))
+            batch.set(doc_ref, {
+                "game_type": game_type,
+                "title": title,
+                "size": size,
+                "rows": top_rows,
+                "updated_at": firestore.SERVER_TIMESTAMP
+            })
+            # Una batch Firestore accetta al massimo 500 scritture
+            if count % 500 == 0:
+                batch.commit()
+                batch = self.db.batch()
+        batch.commit()
+        return len(rankings)
@@ -0,0 +1,86 @@
+import threading
+import time
+from typing import Optional, Dict
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from commons.Config import Config
+from commons.rate_limiter import TokenBucket
+from commons.metrics import get_metrics
+
+HTTP_TIMEOUTS = Config.get("HTTP_TIMEOUTS")
+HTTP_DEFAULT_TIMEOUT = Config.get("HTTP_DEFAULT_TIMEOUT")
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+
+class ChesscomHttpClient:
+    """
+    Client HTTP condiviso per le chiamate a Chess.com: un'unica Session con pool
+    di connessioni keep-alive, retry con backoff esponenziale (rispettando Retry-After)
+    e timeout configurabili per endpoint.
+    """
+
+    def __init__(self, rate_limiter: Optional[TokenBucket] = None) -> None:
+        self.rate_limiter = rate_limiter or TokenBucket(Config.get("REQUEST_RATE"), Config.get("REQUEST_BURST"))
+
+        retry = Retry(
+            total=Config.get("HTTP_MAX_RETRIES"),
+            backoff_factor=Config.get("HTTP_BACKOFF_FACTOR"),
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=Config.get("HTTP_POOL_SIZE"),
+            max_retries=retry,
+        )
+
+        self.session = requests.Session()
+        self.session.headers.update(Config.get("HEADERS"))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url: str, endpoint: str, headers: Optional[Dict[str, str]] = None,
+            rate_limited: bool = True) -> requests.Response:
+        """
+        Esegue una GET con il timeout dell'endpoint indicato.
+        Le chiamate all'API pubblica passano dal rate limiter; gli asset
+        statici (es. avatar) possono saltarlo con rate_limited=False.
+        """
+        metrics = get_metrics()
+        if rate_limited:
+            wait_start = time.perf_counter()
+            self.rate_limiter.acquire()
+            metrics.observe("chesscom_rate_limit_wait_seconds", time.perf_counter() - wait_start, endpoint=endpoint)
+        timeout = HTTP_TIMEOUTS.get(endpoint, HTTP_DEFAULT_TIMEOUT)
+
+        try:
+            with metrics.timed("http", endpoint):
+                response = self.session.get(url, headers=headers, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            metrics.inc("chesscom_http_requests_total", endpoint=endpoint, status=type(e).__name__)
+            raise
+
+        metrics.inc("chesscom_http_requests_total", endpoint=endpoint, status=response.status_code)
+        metrics.inc("chesscom_http_response_bytes_total", len(response.content), endpoint=endpoint)
+        # urllib3 registra i tentativi falliti (es. 429 con Retry-After) nella history del Retry
+        retries = getattr(response.raw, "retries", None)
+        if retries is not None and retries.history:
+            metrics.inc("chesscom_http_retries_total", len(retries.history), endpoint=endpoint)
+        return response
+
+
+_client: Optional[ChesscomHttpClient] = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> ChesscomHttpClient:
+    """Ritorna il client HTTP condiviso dal processo, creandolo alla prima chiamata."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ChesscomHttpClient()
+    return _client
@@ -0,0 +1,205 @@
+"""
+Archivio analitico locale delle partite: file Parquet partizionati per giocatore
+e mese ({root}/user_id={player}/month={YYYY-MM}/part-*.parquet), interrogati con
+DuckDB incorporato nel processo. Serve le domande sulle partite di un singolo
+giocatore in pochi millisecondi, senza job BigQuery; BigQuery resta la fonte
+per le analisi tra più giocatori.
+
+duckdb è una dipendenza opzionale: senza, l'archivio non è disponibile.
+"""
+import datetime
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+try:
+    import duckdb
+except ImportError:  # duckdb è opzionale
+    duckdb = None
+
+from commons.opening_stats import DRAW_RESULTS
+
+# Stesso schema di chess_games (user_id e mese arrivano dalle partizioni)
+COLUMNS = {
+    "game_id": "VARCHAR",
+    "white_player": "VARCHAR",
+    "black_player": "VARCHAR",
+    "rating_white": "INTEGER",
+    "rating_black": "INTEGER",
+    "result_white": "VARCHAR",
+    "result_black": "VARCHAR",
+    "accuracy_white": "DOUBLE",
+    "accuracy_black": "DOUBLE",
+    "time_control": "VARCHAR",
+    "time_class": "VARCHAR",
+    "end_time": "DOUBLE",
+    "moves": "VARCHAR",
+    "eco": "VARCHAR",
+    "url": "VARCHAR",
+}
+
+DRAW_RESULTS_SQL = ", ".join(f"'{result}'" for result in sorted(DRAW_RESULTS))
+
+# Partite del giocatore dal suo punto di vista; le partite scritte più volte vengono contate una volta
+_PLAYER_GAMES_SQL = f"""
+    WITH games AS (
+        SELECT *,
+               lower(white_player) = lower(user_id) AS is_white
+        FROM read_parquet(?, hive_partitioning = true, hive_types = {{'user_id': 'VARCHAR', 'month': 'VARCHAR'}})
+        WHERE month >= ? AND month <= ?
+        QUALIFY row_number() OVER (PARTITION BY game_id ORDER BY end_time) = 1
+    )
+    SELECT game_id, url, eco, time_class, time_control,
+           make_timestamp(CAST(end_time * 1000000 AS BIGINT)) AS end_time,  -- UTC
+           CASE WHEN is_white THEN 'white' ELSE 'black' END AS color,
+           CASE WHEN is_white THEN black_player ELSE white_player END AS opponent,
+           CASE WHEN is_white THEN rating_white ELSE rating_black END AS rating,
+           CASE WHEN is_white THEN rating_black ELSE rating_white END AS opponent_rating,
+           CASE WHEN is_white THEN result_white ELSE result_black END AS result,
+           CASE
+               WHEN (CASE WHEN is_white THEN result_white ELSE result_black END) = 'win' THEN 'win'
+               WHEN (CASE WHEN is_white THEN result_white ELSE result_black END) IN ({DRAW_RESULTS_SQL}) THEN 'draw'
+               ELSE 'loss'
+           END AS outcome,
+           nullif(CASE WHEN is_white THEN accuracy_white ELSE accuracy_black END, 0) AS accuracy,
+           moves
+    FROM games
+"""
+
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def is_available() -> bool:
+    return duckdb is not None
+
+
+class LocalGameStore:
+    """Scrive le righe di chess_games in Parquet e le interroga per giocatore."""
+
+    def __init__(self, root_dir: str) -> None:
+        if duckdb is None:
+            raise RuntimeError("duckdb non è installato: l'archivio locale delle partite non è disponibile")
+        self.root_dir = root_dir
+        os.makedirs(root_dir, exist_ok=True)
+        self._conn = duckdb.connect()
+        self._lock = threading.Lock()
+
+    def _player_dir(self, player: str) -> str:
+        player = player.lower()
+        if not _SAFE_NAME.match(player):
+            raise ValueError(f"Username non valido: {player!r}")
+        return os.path.join(self.root_dir, f"user_id={player}")
+
+    def _cursor(self):
+        # Ogni thread usa un proprio cursore: la connessione DuckDB non va condivisa tra thread
+        with self._lock:
+            return self._conn.cursor()
+
+    def write_rows(self, rows: List[Dict[str, Any]]) -> List[str]:
+        """
+        Scrive le righe (come prodotte per chess_games) in un file Parquet per giocatore e mese.
+        Il nome del file deriva dai game_id contenuti: riscrivere le stesse righe non crea duplicati.
+        Ritorna i file scritti.
+        """
+        groups = defaultdict(list)
+        for row in rows:
+            month = datetime.datetime.utcfromtimestamp(row["end_time"]).strftime("%Y-%m")
+            groups[(row["user_id"], month)].append(row)
+
+        written = []
+        for (player, month), month_rows in groups.items():
+            digest = hashlib.sha1("\n".join(sorted(row["game_id"] for row in month_rows)).encode()).hexdigest()[:16]
+            month_dir = os.path.join(self._player_dir(player), f"month={month}")
+            path = os.path.join(month_dir, f"part-{digest}.parquet")
+            if os.path.exists(path):
+                continue
+            os.makedirs(month_dir, exist_ok=True)
+            self._write_parquet(month_rows, path)
+            written.append(path)
+        return written
+
+    def _write_parquet(self, rows: List[Dict[str, Any]], path: str) -> None:
+        fd, json_path = tempfile.mkstemp(suffix=".ndjson")
+        tmp_path = f"{path}.tmp"
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps({column: row.get(column) for column in COLUMNS}, ensure_ascii=False))
+                    f.write("\n")
+            columns = "{" + ", ".join(f"'{name}': '{sql_type}'" for name, sql_type in COLUMNS.items()) + "}"
+            self._cursor().execute(
+                f"COPY (SELECT * FROM read_json(?, format = 'newline_delimited', columns = {columns}) ORDER BY end_time) "
+                f"TO '{tmp_path}' (FORMAT PARQUET, COMPRESSION ZSTD)",
+                [json_path]
+            )
+            # Il file compare solo completo: una lettura concorrente non vede mai Parquet troncati
+            os.replace(tmp_path, path)
+        finally:
+            os.remove(json_path)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _query(self, player: str, sql: str, params: List[Any], start_date: Optional[str],
+               end_date: Optional[str]) -> List[Dict[str, Any]]:
+        player_dir = self._player_dir(player)
+        if not os.path.isdir(player_dir):
+            return []
+        first_month = start_date[:7] if start_date else "0000-00"
+        last_month = end_date[:7] if end_date else "9999-99"
+        cursor = self._cursor()
+        # Il filtro sul mese delle partizioni esclude i file fuori intervallo senza leggerli
+        result = cursor.execute(
+            sql,
+            [os.path.join(player_dir, "*", "*.parquet"), first_month, last_month] + params
+        )
+        columns = [column[0] for column in result.description]
+        return [dict(zip(columns, row)) for row in result.fetchall()]
+
+    @staticmethod
+    def _filters(time_class: Optional[str], start_date: Optional[str], end_date: Optional[str]):
+        conditions, params = [], []
+        if time_class:
+            conditions.append("time_class = ?")
+            params.append(time_class)
+        if start_date:
+            conditions.append("end_time >= CAST(? AS TIMESTAMP)")
+            params.append(start_date)
+        if end_date:
+            conditions.append("end_time < CAST(? AS TIMESTAMP) + INTERVAL 1 DAY")
+            params.append(end_date)
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+    def player_games(self, player: str, limit: int = 50, offset: int = 0, time_class: Optional[str] = None,
+                     start_date: Optional[str] = None, end_date: Optional[str] = None,
+                     include_moves: bool = False) -> List[Dict[str, Any]]:
+        """Partite del giocatore dalla più recente, con colore, avversario ed esito dal suo punto di vista."""
+        where, params = self._filters(time_class, start_date, end_date)
+        columns = "*" if include_moves else "* EXCLUDE (moves)"
+        sql = f"SELECT {columns} FROM ({_PLAYER_GAMES_SQL}){where} ORDER BY end_time DESC LIMIT ? OFFSET ?"
+        return self._query(player, sql, params + [limit, offset], start_date, end_date)
+
+    def player_stats(self, player: str, time_class: Optional[str] = None,
+                     start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Statistiche per time_class: partite, vittorie, sconfitte, patte, rating e accuracy medi."""
+        where, params = self._filters(time_class, start_date, end_date)
+        sql = f"""
+            SELECT time_class,
+                   count(*) AS games,
+                   count(*) FILTER (WHERE outcome = 'win') AS win,
+                   count(*) FILTER (WHERE outcome = 'loss') AS loss,
+                   count(*) FILTER (WHERE outcome = 'draw') AS draw,
+                   round(avg(rating), 1) AS avg_rating,
+                   round(avg(opponent_rating), 1) AS avg_opponent_rating,
+                   round(avg(accuracy), 2) AS avg_accuracy,
+                   min(end_time) AS first_game,
+                   max(end_time) AS last_game
+            FROM ({_PLAYER_GAMES_SQL}){where}
+            GROUP BY time_class
+            ORDER BY games DESC
+        """
+        return self._query(player, sql, params, start_date, end_date)
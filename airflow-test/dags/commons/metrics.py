@@ -0,0 +1,180 @@
+"""
+Metriche della pipeline di raccolta dati in formato Prometheus.
+
+Contatori e istogrammi (con label) sono tenuti in memoria dal processo e possono
+essere esportati come testo Prometheus: in un file per il textfile collector di
+node_exporter oppure verso un Pushgateway, visto che i job batch non restano in
+ascolto per lo scraping. summary() riassume quanto misurato a partire da uno snapshot,
+ad esempio dall'inizio di un run.
+"""
+import bisect
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Secondi: dalle letture Firestore veloci ai load job BigQuery
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+METRIC_HELP = {
+    "chesscom_stage_seconds": "Durata delle chiamate esterne per stage (http, firestore, gcs, bigquery) e operazione",
+    "chesscom_http_requests_total": "Richieste HTTP verso Chess.com per endpoint e status",
+    "chesscom_http_retries_total": "Retry eseguiti dal client HTTP per endpoint",
+    "chesscom_http_response_bytes_total": "Byte ricevuti da Chess.com per endpoint",
+    "chesscom_rate_limit_wait_seconds": "Attesa nel rate limiter prima di una richiesta",
+    "chesscom_gcs_bytes_total": "Byte trasferiti da e verso Cloud Storage per operazione",
+    "chesscom_gcs_files_total": "File caricati, scaricati o eliminati su Cloud Storage per operazione",
+    "chesscom_games_staged_total": "Partite scritte nei file di staging",
+    "chesscom_rows_loaded_total": "Righe caricate in BigQuery per tabella",
+    "chesscom_games_position_indexed_total": "Partite aggiunte all'indice delle posizioni per esito",
+    "chesscom_sink_errors_total": "Errori di scrittura delle copie secondarie delle partite per sink",
+    "chesscom_players_total": "Giocatori elaborati per operazione ed esito",
+    "chesscom_run_seconds": "Durata dei run della pipeline",
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    """Registro thread-safe di contatori e istogrammi."""
+
+    def __init__(self) -> None:
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timed(self, stage: str, operation: str) -> Iterator[None]:
+        """Misura la durata del blocco in chesscom_stage_seconds, anche se solleva un'eccezione."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("chesscom_stage_seconds", time.perf_counter() - start, stage=stage, operation=operation)
+
+    def render(self) -> str:
+        """Esporta tutte le metriche nel formato testuale di Prometheus."""
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._counters):
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+            for name in sorted(self._histograms):
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(histogram.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[Tuple[str, LabelKey], Tuple[float, float]]:
+        """Valori correnti (contatore, oppure count e sum degli istogrammi) da passare a summary()."""
+        with self._lock:
+            values = {(name, key): (value, 0.0) for name, series in self._counters.items() for key, value in series.items()}
+            values.update({(name, key): (h.count, h.sum) for name, series in self._histograms.items() for key, h in series.items()})
+        return values
+
+    def summary(self, since: Optional[Dict[Tuple[str, LabelKey], Tuple[float, float]]] = None) -> List[str]:
+        """Righe leggibili con quanto misurato dopo lo snapshot `since` (o dall'avvio del processo)."""
+        since = since or {}
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                for key, histogram in sorted(series.items()):
+                    count_before, sum_before = since.get((name, key), (0, 0.0))
+                    count, total = histogram.count - count_before, histogram.sum - sum_before
+                    if count:
+                        labels = " ".join(label for _, label in key)
+                        lines.append(f"{name} [{labels}]: {count} chiamate, {total:.2f}s (media {total / count:.3f}s)")
+            for name, series in sorted(self._counters.items()):
+                for key, value in sorted(series.items()):
+                    delta = value - since.get((name, key), (0.0, 0.0))[0]
+                    if delta:
+                        labels = " ".join(label for _, label in key)
+                        lines.append(f"{name} [{labels}]: {_format_value(delta)}")
+        return lines
+
+    def write_textfile(self, directory: str, job: str) -> str:
+        """Scrive {directory}/{job}.prom in modo atomico (textfile collector di node_exporter)."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{job}.prom")
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".prom.tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+        return path
+
+    def push(self, gateway_url: str, job: str, timeout: float = 10) -> None:
+        """Invia le metriche a un Prometheus Pushgateway, sostituendo quelle del job."""
+        import requests
+
+        response = requests.put(
+            f"{gateway_url.rstrip('/')}/metrics/job/{job}",
+            data=self.render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4"},
+            timeout=timeout,
+        )
+        response.raise_for_status()
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """Registro delle metriche condiviso dal processo."""
+    return _metrics
@@ -0,0 +1,49 @@
+import re
+from typing import List
+
+# Un'unica regex compilata una volta sola: ogni alternativa consuma un elemento
+# del PGN e solo le mosse SAN finiscono nel gruppo catturato.
+_TOKEN_RE = re.compile(r"""
+      \{[^}]*\}                 # commenti e annotazioni del clock {[%clk 0:02:59.9]}
+    | ;[^\n]*                   # commenti fino a fine riga
+    | \[[^\]]*\]                # tag dell'header [Event "Live Chess"]
+    | \$\d+                     # NAG
+    | (?:1-0|0-1|1/2-1/2|\*)    # risultato
+    | \d+\.(?:\.\.)?            # numeri di mossa (1. e 1...)
+    | ([()])                    # delimitatori delle varianti
+    | ([^\s{}\[\]();$!?]+)      # mossa SAN
+""", re.VERBOSE)
+
+
+def _movetext_start(pgn: str) -> int:
+    """Posizione della prima riga vuota dopo l'header, da cui iniziano le mosse."""
+    if not pgn.lstrip().startswith("["):
+        return 0
+    start = pgn.find("\n\n")
+    return start if start != -1 else 0
+
+
+def tokenize_moves(pgn: str) -> List[str]:
+    """
+    Ritorna le mosse SAN della linea principale di un PGN, in una sola scansione.
+    Header, commenti, clock, NAG, numeri di mossa, risultato e varianti vengono scartati.
+    """
+    start = _movetext_start(pgn)
+    if pgn.find("(", start) == -1:
+        return [san for _, san in _TOKEN_RE.findall(pgn, start) if san]
+
+    moves = []
+    depth = 0
+    for paren, san in _TOKEN_RE.findall(pgn, start):
+        if paren == "(":
+            depth += 1
+        elif paren == ")":
+            depth = max(depth - 1, 0)
+        elif san and depth == 0:
+            moves.append(san)
+    return moves
+
+
+def extract_moves(pgn: str) -> str:
+    """Ritorna le mosse SAN della linea principale separate da uno spazio."""
+    return " ".join(tokenize_moves(pgn))
@@ -0,0 +1,33 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Rate limiter token-bucket thread-safe, condiviso tra tutte le richieste di un collector."""
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """
+        Prenota un token e ritorna i secondi da attendere prima di usarlo.
+        Il saldo può andare in negativo: le richieste successive si accodano.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self) -> None:
+        """Blocca il thread corrente finché non è disponibile un token."""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
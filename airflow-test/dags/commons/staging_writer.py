@@ -0,0 +1,118 @@
+import gzip
+import json
+import os
+import tempfile
+from typing import Optional, Dict, Any, List, Tuple
+from commons.bucket_manager import BucketManager
+from commons.local_game_store import LocalGameStore
+from commons.position_index import PositionIndex
+from commons.metrics import get_metrics
+from commons.Config import Config
+
+logger = Config.init_logging()
+
+
+class GameStagingWriter:
+    """
+    Accumula in memoria le righe delle partite e le scrive come file NDJSON compressi
+    (gzip), pronti per un load job BigQuery. I file vengono preparati in locale e caricati
+    in parallelo nel bucket di staging da upload().
+    Se è indicato un LocalGameStore, le stesse righe vengono scritte anche in Parquet;
+    se è indicato un PositionIndex, le partite vengono aggiunte all'indice delle posizioni.
+    Gli errori di queste copie secondarie vengono registrati senza interrompere lo staging.
+    """
+
+    def __init__(self, bucket: BucketManager, prefix: str, max_rows: int = 50000,
+                 local_store: Optional[LocalGameStore] = None,
+                 position_index: Optional[PositionIndex] = None) -> None:
+        self.bucket = bucket
+        self.local_store = local_store
+        self.position_index = position_index
+        self.prefix = prefix.rstrip("/")
+        self.max_rows = max_rows
+        self.rows: List[Dict[str, Any]] = []
+        self.position_rows: List[Dict[str, Any]] = []
+        self.staged_files: List[str] = []
+        self.pending_uploads: List[Tuple[str, str]] = []
+        self.rows_written = 0
+
+    def add(self, row: Dict[str, Any], index_positions: bool = True) -> None:
+        """
+        Aggiunge una riga al buffer e lo svuota quando raggiunge max_rows.
+        index_positions=False esclude la partita dall'indice delle posizioni (es. Chess960).
+        """
+        self.rows.append(row)
+        if self.position_index is not None and index_positions:
+            self.position_rows.append(row)
+        if len(self.rows) >= self.max_rows:
+            self.flush()
+
+    def flush(self) -> Optional[str]:
+        """Scrive il buffer in un file NDJSON compresso locale, da caricare nel bucket con upload()."""
+        if not self.rows:
+            return None
+
+        blob_path = f"{self.prefix}/part-{len(self.staged_files):05d}.ndjson.gz"
+        fd, local_path = tempfile.mkstemp(suffix=".ndjson.gz")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+                for row in self.rows:
+                    f.write(json.dumps(row, ensure_ascii=False))
+                    f.write("\n")
+        except Exception:
+            os.remove(local_path)
+            raise
+        self.pending_uploads.append((local_path, blob_path))
+
+        metrics = get_metrics()
+        metrics.inc("chesscom_games_staged_total", len(self.rows))
+        if self.local_store is not None:
+            try:
+                with metrics.timed("local_store", "write_parquet"):
+                    self.local_store.write_rows(self.rows)
+            except Exception as e:
+                # L'archivio locale è una copia: le partite restano nello staging verso BigQuery
+                logger.log_text(f"Errore nella scrittura dell'archivio locale ({self.prefix}): {str(e)}", severity="WARNING")
+                metrics.inc("chesscom_sink_errors_total", sink="local_store")
+        if self.position_rows:
+            try:
+                with metrics.timed("position_index", "add_games"):
+                    indexed = self.position_index.add_games(self.position_rows)
+                for status, count in indexed.items():
+                    metrics.inc("chesscom_games_position_indexed_total", count, status=status)
+            except Exception as e:
+                # Es. "database is locked" con più shard sullo stesso file: l'indice si ricostruisce con build_position_index
+                logger.log_text(f"Errore nell'indicizzazione delle posizioni ({self.prefix}): {str(e)}", severity="WARNING")
+                metrics.inc("chesscom_sink_errors_total", sink="position_index")
+            self.position_rows = []
+
+        self.rows_written += len(self.rows)
+        self.rows = []
+        self.staged_files.append(blob_path)
+        return blob_path
+
+    def upload(self) -> Dict[str, float]:
+        """
+        Carica in parallelo (BucketManager.upload_files) i file preparati da flush(),
+        poi li elimina dal disco. Ritorna il throughput.
+        """
+        if not self.pending_uploads:
+            return {}
+        try:
+            with get_metrics().timed("gcs", "upload_staging"):
+                return self.bucket.upload_files(self.pending_uploads, operation="upload_staging")
+        finally:
+            self.discard()
+
+    def discard(self) -> None:
+        """Elimina i file locali non ancora caricati."""
+        for local_path, _ in self.pending_uploads:
+            if os.path.exists(local_path):
+                os.remove(local_path)
+        self.pending_uploads = []
+
+    def close(self) -> List[str]:
+        """Svuota il buffer residuo, carica i file nel bucket e ritorna i file di staging del writer."""
+        self.flush()
+        self.upload()
+        return self.staged_files
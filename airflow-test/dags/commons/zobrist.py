@@ -0,0 +1,304 @@
+"""
+Posizioni degli scacchi e hash di Zobrist a 64 bit.
+
+Position rigioca le mosse SAN salvate in chess_games (colonna moves) controllandone
+la legalità e calcola l'hash di Zobrist della posizione: pezzi sulle case, tratto,
+diritti di arrocco e colonna dell'en passant, quest'ultima solo se la presa è
+possibile (come nel formato Polyglot), così la stessa posizione ha lo stesso hash
+sia rigiocando una partita sia partendo da un FEN.
+
+Le chiavi sono generate da un seed fisso: cambiarlo invalida gli indici già costruiti.
+"""
+import random
+import re
+from typing import Iterable, List, Optional, Union
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+PIECES = "PNBRQKpnbrqk"
+CASTLING_RIGHTS = "KQkq"
+
+_rng = random.Random(0x5A0B1257)
+PIECE_KEYS = [[_rng.getrandbits(64) for _ in range(64)] for _ in PIECES]
+CASTLING_KEYS = {right: _rng.getrandbits(64) for right in CASTLING_RIGHTS}
+EP_KEYS = [_rng.getrandbits(64) for _ in range(8)]
+TURN_KEY = _rng.getrandbits(64)  # applicata quando muove il nero
+_PIECE_INDEX = {piece: index for index, piece in enumerate(PIECES)}
+
+_SAN_RE = re.compile(r"""^(?:
+      (?P<long>O-O-O|0-0-0)
+    | (?P<short>O-O|0-0)
+    | (?P<piece>[NBRQK])?(?P<file>[a-h])?(?P<rank>[1-8])?x?(?P<to>[a-h][1-8])(?:=?(?P<promotion>[NBRQ]))?
+)[+#]*[!?]*$""", re.VERBOSE)
+
+
+def _square(file: int, rank: int) -> Optional[int]:
+    return rank * 8 + file if 0 <= file < 8 and 0 <= rank < 8 else None
+
+
+def _steps(deltas) -> List[List[int]]:
+    return [[s for s in (_square(sq % 8 + df, sq // 8 + dr) for df, dr in deltas) if s is not None]
+            for sq in range(64)]
+
+
+def _rays(directions) -> List[List[List[int]]]:
+    rays = []
+    for sq in range(64):
+        square_rays = []
+        for df, dr in directions:
+            ray, file, rank = [], sq % 8 + df, sq // 8 + dr
+            while 0 <= file < 8 and 0 <= rank < 8:
+                ray.append(rank * 8 + file)
+                file, rank = file + df, rank + dr
+            square_rays.append(ray)
+        rays.append(square_rays)
+    return rays
+
+
+KNIGHT_TARGETS = _steps(((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)))
+KING_TARGETS = _steps(((1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)))
+ROOK_RAYS = _rays(((1, 0), (-1, 0), (0, 1), (0, -1)))
+BISHOP_RAYS = _rays(((1, 1), (1, -1), (-1, 1), (-1, -1)))
+
+# Case il cui pezzo, se muove o viene catturato, fa perdere i diritti di arrocco indicati
+_CASTLING_SQUARES = {0: "Q", 4: "KQ", 7: "K", 56: "q", 60: "kq", 63: "k"}
+# Lato → (casa del re, casa di arrivo del re, casa della torre, casa di arrivo della torre, case da liberare)
+_CASTLING_MOVES = {
+    "K": (4, 6, 7, 5, (5, 6)),
+    "Q": (4, 2, 0, 3, (1, 2, 3)),
+    "k": (60, 62, 63, 61, (61, 62)),
+    "q": (60, 58, 56, 59, (57, 58, 59)),
+}
+
+
+class Position:
+    """Posizione sulla scacchiera: case 0-63 da a1 a h8, pezzi bianchi maiuscoli e neri minuscoli."""
+
+    __slots__ = ("board", "white", "castling", "ep")
+
+    def __init__(self, board: List[Optional[str]], white: bool, castling: str, ep: Optional[int]) -> None:
+        self.board = board
+        self.white = white
+        self.castling = castling
+        self.ep = ep
+
+    @classmethod
+    def start(cls) -> "Position":
+        return cls.from_fen(START_FEN)
+
+    @classmethod
+    def from_fen(cls, fen: str) -> "Position":
+        """Legge i primi quattro campi di un FEN (contatori delle mosse facoltativi e ignorati)."""
+        fields = fen.split()
+        if not fields:
+            raise ValueError("FEN vuoto")
+        placement, turn, castling, ep = (fields + ["w", "-", "-"][len(fields) - 1:])[:4]
+
+        ranks = placement.split("/")
+        if len(ranks) != 8:
+            raise ValueError(f"FEN non valido: {fen!r}")
+        board: List[Optional[str]] = [None] * 64
+        for rank_index, rank in enumerate(ranks):
+            file = 0
+            for char in rank:
+                if char.isdigit():
+                    file += int(char)
+                elif char in PIECES and file < 8:
+                    board[(7 - rank_index) * 8 + file] = char
+                    file += 1
+                else:
+                    raise ValueError(f"FEN non valido: {fen!r}")
+            if file != 8:
+                raise ValueError(f"FEN non valido: {fen!r}")
+        if board.count("K") != 1 or board.count("k") != 1:
+            raise ValueError(f"FEN non valido, serve un re per colore: {fen!r}")
+        if turn not in ("w", "b") or (castling != "-" and set(castling) - set(CASTLING_RIGHTS)):
+            raise ValueError(f"FEN non valido: {fen!r}")
+        if ep != "-" and not re.match(r"^[a-h][36]$", ep):
+            raise ValueError(f"FEN non valido: {fen!r}")
+
+        return cls(
+            board,
+            turn == "w",
+            "".join(right for right in CASTLING_RIGHTS if right in castling),
+            _square(ord(ep[0]) - ord("a"), int(ep[1]) - 1) if ep != "-" else None,
+        )
+
+    def copy(self) -> "Position":
+        return Position(self.board[:], self.white, self.castling, self.ep)
+
+    def is_attacked(self, square: int, by_white: bool) -> bool:
+        """True se la casa è attaccata da un pezzo del colore indicato."""
+        board = self.board
+        pawn, knight, king = ("P", "N", "K") if by_white else ("p", "n", "k")
+        rook_like, bishop_like = ("RQ", "BQ") if by_white else ("rq", "bq")
+
+        file, rank = square % 8, square // 8
+        pawn_rank = rank - 1 if by_white else rank + 1
+        for df in (-1, 1):
+            source = _square(file + df, pawn_rank)
+            if source is not None and board[source] == pawn:
+                return True
+        if any(board[s] == knight for s in KNIGHT_TARGETS[square]):
+            return True
+        if any(board[s] == king for s in KING_TARGETS[square]):
+            return True
+        for rays, attackers in ((ROOK_RAYS, rook_like), (BISHOP_RAYS, bishop_like)):
+            for ray in rays[square]:
+                for s in ray:
+                    if board[s] is not None:
+                        if board[s] in attackers:
+                            return True
+                        break
+        return False
+
+    def in_check(self, white: bool) -> bool:
+        return self.is_attacked(self.board.index("K" if white else "k"), not white)
+
+    def push_san(self, san: str) -> None:
+        """Esegue una mossa in notazione SAN; solleva ValueError se è illegale o ambigua."""
+        match = _SAN_RE.match(san)
+        if not match:
+            raise ValueError(f"Mossa SAN non valida: {san!r}")
+        if match.group("long") or match.group("short"):
+            self._castle(("K" if match.group("short") else "Q") if self.white else ("k" if match.group("short") else "q"))
+            return
+
+        to = (int(match.group("to")[1]) - 1) * 8 + ord(match.group("to")[0]) - ord("a")
+        target = self.board[to]
+        if target is not None and target.isupper() == self.white:
+            raise ValueError(f"Mossa illegale: {san!r}")
+
+        piece, promotion = match.group("piece"), match.group("promotion")
+        if piece is None:
+            sources = self._pawn_sources(to, match.group("file"))
+            last_rank = to // 8 == (7 if self.white else 0)
+            if last_rank != (promotion is not None):
+                raise ValueError(f"Mossa illegale: {san!r}")
+        else:
+            if promotion:
+                raise ValueError(f"Mossa SAN non valida: {san!r}")
+            sources = self._piece_sources(piece if self.white else piece.lower(), to)
+            if match.group("file"):
+                sources = [s for s in sources if s % 8 == ord(match.group("file")) - ord("a")]
+        if match.group("rank"):
+            sources = [s for s in sources if s // 8 == int(match.group("rank")) - 1]
+
+        legal = []
+        for source in sources:
+            after = self.copy()
+            after._move(source, to, promotion)
+            if not after.in_check(self.white):
+                legal.append(after)
+        if len(legal) != 1:
+            raise ValueError(f"Mossa {'ambigua' if legal else 'illegale'}: {san!r}")
+        after = legal[0]
+        self.board, self.white, self.castling, self.ep = after.board, after.white, after.castling, after.ep
+
+    def _pawn_sources(self, to: int, from_file: Optional[str]) -> List[int]:
+        pawn, step = ("P", 8) if self.white else ("p", -8)
+        if from_file is not None:
+            source = to - step + (ord(from_file) - ord("a")) - to % 8
+            capturable = self.board[to] is not None or to == self.ep
+            if abs(ord(from_file) - ord("a") - to % 8) == 1 and capturable and self.board[source] == pawn:
+                return [source]
+            return []
+        if self.board[to] is not None:
+            return []
+        if self.board[to - step] == pawn:
+            return [to - step]
+        double_push_rank = 3 if self.white else 4
+        if to // 8 == double_push_rank and self.board[to - step] is None and self.board[to - 2 * step] == pawn:
+            return [to - 2 * step]
+        return []
+
+    def _piece_sources(self, piece: str, to: int) -> List[int]:
+        kind = piece.upper()
+        if kind == "N":
+            return [s for s in KNIGHT_TARGETS[to] if self.board[s] == piece]
+        if kind == "K":
+            return [s for s in KING_TARGETS[to] if self.board[s] == piece]
+        rays = (ROOK_RAYS[to] if kind in "RQ" else []) + (BISHOP_RAYS[to] if kind in "BQ" else [])
+        sources = []
+        for ray in rays:
+            for s in ray:
+                if self.board[s] is not None:
+                    if self.board[s] == piece:
+                        sources.append(s)
+                    break
+        return sources
+
+    def _move(self, source: int, to: int, promotion: Optional[str] = None) -> None:
+        board = self.board
+        piece = board[source]
+        is_pawn = piece in ("P", "p")
+        if is_pawn and to == self.ep and board[to] is None:
+            board[to - 8 if self.white else to + 8] = None  # presa en passant
+        board[to] = (promotion if self.white else promotion.lower()) if promotion else piece
+        board[source] = None
+
+        for square in (source, to):
+            for right in _CASTLING_SQUARES.get(square, ""):
+                self.castling = self.castling.replace(right, "")
+        self.ep = (source + to) // 2 if is_pawn and abs(to - source) == 16 else None
+        self.white = not self.white
+
+    def _castle(self, side: str) -> None:
+        king_from, king_to, rook_from, rook_to, between = _CASTLING_MOVES[side]
+        king, rook = ("K", "R") if self.white else ("k", "r")
+        if (side not in self.castling or self.board[king_from] != king or self.board[rook_from] != rook
+                or any(self.board[s] is not None for s in between)):
+            raise ValueError(f"Arrocco illegale: {side}")
+        # Il re non può arroccare sotto scacco né attraversare o raggiungere case attaccate
+        path = range(min(king_from, king_to), max(king_from, king_to) + 1)
+        if any(self.is_attacked(s, not self.white) for s in path):
+            raise ValueError(f"Arrocco illegale: {side}")
+
+        self.board[king_to], self.board[king_from] = king, None
+        self.board[rook_to], self.board[rook_from] = rook, None
+        for right in ("KQ" if self.white else "kq"):
+            self.castling = self.castling.replace(right, "")
+        self.ep = None
+        self.white = not self.white
+
+    def _ep_capturable(self) -> bool:
+        if self.ep is None:
+            return False
+        pawn, source_rank = ("P", 4) if self.white else ("p", 3)
+        file = self.ep % 8
+        return any(self.board[source_rank * 8 + f] == pawn for f in (file - 1, file + 1) if 0 <= f < 8)
+
+    def zobrist(self) -> int:
+        """Hash di Zobrist a 64 bit (senza segno) della posizione."""
+        h = 0
+        for square, piece in enumerate(self.board):
+            if piece is not None:
+                h ^= PIECE_KEYS[_PIECE_INDEX[piece]][square]
+        for right in self.castling:
+            h ^= CASTLING_KEYS[right]
+        if self._ep_capturable():
+            h ^= EP_KEYS[self.ep % 8]
+        if not self.white:
+            h ^= TURN_KEY
+        return h
+
+
+def position_hashes(moves: Union[str, Iterable[str]], max_ply: int) -> List[int]:
+    """
+    Hash delle posizioni di una partita dalla posizione iniziale (ply 0) fino a max_ply.
+    Solleva ValueError alla prima mossa illegale: le posizioni successive non sarebbero affidabili.
+    """
+    if isinstance(moves, str):
+        moves = moves.split()
+    position = Position.start()
+    hashes = [position.zobrist()]
+    for ply, san in enumerate(moves, start=1):
+        if ply > max_ply:
+            break
+        position.push_san(san)
+        hashes.append(position.zobrist())
+    return hashes
+
+
+def fen_hash(fen: str) -> int:
+    return Position.from_fen(fen).zobrist()
@@ -0,0 +1,192 @@
+"""
+Benchmark end-to-end della raccolta dati, senza Chess.com e GCP reali.
+
+Avvia il finto server Chess.com (benchmarks/fake_chesscom.py), sostituisce i client
+Google Cloud con quelli in memoria (benchmarks/fake_gcp.py) e misura
+fetch_chess_data, fetch_and_store_games e copy_firestore_to_bigquery:
+giocatori/s, partite/s, richieste HTTP ricevute dal server e picco di RSS.
+Ogni scenario gira in un processo separato, quindi il picco di RSS è solo suo.
+
+Uso:
+    python benchmarks/bench_ingestion.py [--players 50] [--games-per-month 30]
+        [--latency 0.02] [--error-rate 0.01] [--rate 200] [--fixtures dir]
+        [--scenario fetch_and_store_games] [--incremental] [--json]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(BACKEND_DIR)
+
+from fake_chesscom import ChesscomFixtures, FakeChesscomServer
+
+SCENARIOS = ["fetch_chess_data", "fetch_and_store_games", "copy_firestore_to_bigquery"]
+
+
+def _rss_mb() -> float:
+    """RSS attuale del processo (Linux), oppure il picco se /proc non è disponibile."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1_000_000
+    except (OSError, ValueError):
+        return _peak_rss_mb()
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss è in KB su Linux e in byte su macOS
+    return peak / 1_000_000 if sys.platform == "darwin" else peak / 1_000
+
+
+def build_fixtures(args) -> ChesscomFixtures:
+    if args.fixtures:
+        return ChesscomFixtures.load_dir(args.fixtures)
+    return ChesscomFixtures.synthetic(args.players, args.games_per_month, seed=args.seed)
+
+
+def run_scenario(args) -> dict:
+    """Eseguito nel processo figlio: prepara i client finti, esegue lo scenario e ne ritorna le misure."""
+    os.environ["CHESSCOM_API_BASE"] = args.api_base
+    os.environ["CHESSCOM_ARCHIVE_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench_archive_cache_")
+
+    from fake_gcp import install_fake_clients
+    clients = install_fake_clients()
+
+    # I moduli di commons leggono Config e creano il logger all'import: vanno importati dopo
+    from commons.Config import Config
+    from commons.chesscom_data_collector import ChesscomDataCollector
+    from commons.http_client import ChesscomHttpClient
+    from commons.rate_limiter import TokenBucket
+
+    users_collection = Config.get("FIRESTORE_CHESSCOM_USERS_COLLECTION")
+    http_client = ChesscomHttpClient(rate_limiter=TokenBucket(args.rate, args.rate))
+    collector = ChesscomDataCollector(http_client=http_client)
+    players, games = 0, 0
+
+    if args.run_scenario == "copy_firestore_to_bigquery":
+        # I giocatori vengono scritti direttamente dalle fixture, senza richieste HTTP
+        fixtures = build_fixtures(args)
+        for username in fixtures.players:
+            profile = json.loads(fixtures.responses[f"/pub/player/{username}"])
+            stats = json.loads(fixtures.responses.get(f"/pub/player/{username}/stats", b"{}"))
+            collector.save_to_firestore(username, stats, profile, None)
+
+    baseline_rss = _rss_mb()
+    start = time.perf_counter()
+
+    if args.run_scenario == "fetch_chess_data":
+        collector.fetch_chess_data(concurrent=True, batched=True)
+        players = clients["firestore"].count(users_collection)
+    elif args.run_scenario == "fetch_and_store_games":
+        with open(args.player_file) as f:
+            player_names = json.load(f)
+        collector.fetch_and_store_games(player_names, incremental=args.incremental)
+        players = len(player_names)
+        games = clients["bigquery"].loaded_rows.get(
+            f"{Config.get('PROJECT')}.{Config.get('BQ_DATASET_CHESSCOM')}.chess_games", 0
+        )
+    else:
+        from pipelines.copy_firestore_to_bigquery import copy_firestore_to_bigquery
+        copy_firestore_to_bigquery(incremental=args.incremental)
+        players = clients["firestore"].count(users_collection)
+        games = sum(clients["bigquery"].loaded_rows.values())
+
+    elapsed = time.perf_counter() - start
+    return {
+        "scenario": args.run_scenario,
+        "seconds": elapsed,
+        "players": players,
+        "rows": games,
+        "players_per_sec": players / elapsed if elapsed else 0.0,
+        "rows_per_sec": games / elapsed if elapsed else 0.0,
+        "firestore_reads": clients["firestore"].reads,
+        "firestore_writes": clients["firestore"].writes,
+        "bigquery_load_jobs": clients["bigquery"].load_jobs,
+        "baseline_rss_mb": baseline_rss,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--games-per-month", type=int, default=30)
+    parser.add_argument("--fixtures", help="directory di fixture registrate con fake_chesscom.py record")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.02, help="latenza del finto server in secondi")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.01, help="frazione di risposte 429")
+    parser.add_argument("--rate", type=float, default=200, help="richieste/s concesse dal rate limiter")
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append", help="ripetibile; default: tutti")
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--json", action="store_true", help="stampa i risultati in JSON")
+    # Usati internamente per eseguire uno scenario nel processo figlio
+    parser.add_argument("--run-scenario", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--api-base", help=argparse.SUPPRESS)
+    parser.add_argument("--player-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        print(json.dumps(run_scenario(args)))
+        return
+
+    fixtures = build_fixtures(args)
+    fd, player_file = tempfile.mkstemp(suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump(fixtures.players, f)
+
+    results = []
+    server = FakeChesscomServer(fixtures, latency=args.latency, jitter=args.jitter,
+                                error_rate=args.error_rate, seed=args.seed).start()
+    try:
+        for scenario in args.scenario or SCENARIOS:
+            server.reset_stats()
+            command = [
+                sys.executable, os.path.abspath(__file__),
+                "--run-scenario", scenario,
+                "--api-base", server.api_base,
+                "--player-file", player_file,
+                "--players", str(args.players),
+                "--games-per-month", str(args.games_per_month),
+                "--seed", str(args.seed),
+                "--rate", str(args.rate),
+            ]
+            if args.fixtures:
+                command += ["--fixtures", args.fixtures]
+            if args.incremental:
+                command.append("--incremental")
+
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(completed.stdout[-2000:])
+                print(completed.stderr[-4000:], file=sys.stderr)
+                raise SystemExit(f"❌ Scenario {scenario} fallito (exit code {completed.returncode})")
+
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            http_stats = server.stats()
+            result["requests"] = http_stats["total"]
+            result["requests_by_endpoint"] = http_stats["by_endpoint"]
+            result["throttled"] = http_stats["by_status"].get(429, 0)
+            results.append(result)
+    finally:
+        server.stop()
+        os.remove(player_file)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'scenario':<28} {'tempo':>8} {'giocatori/s':>12} {'righe/s':>10} {'richieste':>10} {'429':>5} {'picco RSS':>10}")
+    for r in results:
+        print(f"{r['scenario']:<28} {r['seconds']:>7.2f}s {r['players_per_sec']:>12.1f} {r['rows_per_sec']:>10.0f} "
+              f"{r['requests']:>10} {r['throttled']:>5} {r['peak_rss_mb']:>8.0f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Micro-benchmark dell'estrazione delle mosse dal PGN.
+
+Confronta il tokenizer a passata singola (commons.pgn_tokenizer) con la vecchia
+implementazione a regex di extract_moves_from_pgn e stampa le partite al secondo.
+
+Uso:
+    python benchmarks/bench_pgn_tokenizer.py [--pgn export.pgn] [--repeat 2000]
+
+Con --pgn si può usare un export scaricato da Chess.com
+(https://api.chess.com/pub/player/{username}/games/{YYYY}/{MM}/pgn).
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from commons import pgn_tokenizer
+
+DEFAULT_PGN = os.path.join(os.path.dirname(__file__), "fixtures", "chesscom_games.pgn")
+
+
+def legacy_extract_moves_from_pgn(pgn: str) -> str:
+    """Implementazione precedente di ChesscomDataCollector.extract_moves_from_pgn."""
+    move_lines = []
+
+    for line in pgn.strip().split('\n'):
+        if re.match(r'^\d+\.', line):
+            move_lines.append(line)
+
+    all_moves_text = ' '.join(move_lines)
+
+    all_moves_text = re.sub(r'\{[^}]*\}', '', all_moves_text)
+
+    all_moves_text = re.sub(r'\s(0-1|1-0|1\/2-1\/2)$', '', all_moves_text)
+    all_moves_text = re.sub(r'\s+', ' ', all_moves_text).strip()
+
+    return all_moves_text
+
+
+def load_games(path: str) -> list:
+    """Divide un file PGN multi-partita nelle singole partite."""
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    games = re.split(r'\n\s*\n(?=\[Event )', content.strip())
+    return [game for game in games if game.strip()]
+
+
+def run(name: str, func, games: list, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for game in games:
+            func(game)
+    elapsed = time.perf_counter() - start
+    games_per_sec = repeat * len(games) / elapsed
+    print(f"{name:<28} {games_per_sec:>12,.0f} partite/s  ({elapsed:.2f}s)")
+    return games_per_sec
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pgn", default=DEFAULT_PGN, help="file PGN con una o più partite")
+    parser.add_argument("--repeat", type=int, default=2000, help="numero di passate sull'intero file")
+    args = parser.parse_args()
+
+    games = load_games(args.pgn)
+    print(f"{len(games)} partite da {args.pgn}, {args.repeat} ripetizioni\n")
+
+    legacy = run("regex (precedente)", legacy_extract_moves_from_pgn, games, args.repeat)
+    string = run("tokenizer -> stringa", pgn_tokenizer.extract_moves, games, args.repeat)
+    run("tokenizer -> lista SAN", pgn_tokenizer.tokenize_moves, games, args.repeat)
+
+    print(f"\nspeedup stringa: {string / legacy:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
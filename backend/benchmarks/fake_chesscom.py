@@ -0,0 +1,406 @@
+"""
+Finto server dell'API pubblica di Chess.com per i benchmark.
+
+Risponde su /pub/leaderboards, /pub/player/{username}, /pub/player/{username}/stats,
+/pub/player/{username}/games/archives, /pub/player/{username}/games/{YYYY}/{MM}
+e sugli avatar (/avatars/{username}.png) con fixture sintetiche deterministiche
+oppure registrate dall'API reale. Latenza e risposte 429 sono configurabili;
+le risposte hanno un ETag e rispondono 304 alle richieste condizionali.
+
+Uso:
+    python benchmarks/fake_chesscom.py serve [--players 100] [--latency 0.05] [--error-rate 0.02] [--port 8080]
+    python benchmarks/fake_chesscom.py record hikaru magnuscarlsen --out benchmarks/fixtures/recorded
+
+Con il server avviato basta esportare CHESSCOM_API_BASE=http://127.0.0.1:8080/pub.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_PGN = os.path.join(os.path.dirname(__file__), "fixtures", "chesscom_games.pgn")
+# Sostituito con l'indirizzo del server all'avvio (URL degli avatar e degli archivi)
+BASE_URL_TOKEN = "{{BASE_URL}}"
+LEADERBOARD_TYPES = ["live_bullet", "live_rapid", "daily", "live_blitz"]
+TIME_CLASSES = [("blitz", "180", "chess_blitz"), ("bullet", "60", "chess_bullet"), ("rapid", "600", "chess_rapid")]
+LAST_MODIFIED = "Mon, 01 Jan 2024 00:00:00 GMT"
+
+
+def synthetic_usernames(count: int) -> List[str]:
+    return [f"benchplayer{i:05d}" for i in range(count)]
+
+
+def load_pgns(path: str = DEFAULT_PGN) -> List[str]:
+    """Divide un file PGN multi-partita nelle singole partite."""
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    games = re.split(r'\n\s*\n(?=\[Event )', content.strip())
+    return [game for game in games if game.strip()]
+
+
+def _months(start: datetime.date, end: datetime.date) -> List[Tuple[int, int]]:
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+class ChesscomFixtures:
+    """Risposte dell'API indicizzate per percorso (es. /pub/player/hikaru/stats)."""
+
+    def __init__(self) -> None:
+        self.responses: Dict[str, bytes] = {}
+        self.players: List[str] = []
+
+    def add_json(self, path: str, payload) -> None:
+        self.responses[path.lower()] = json.dumps(payload).encode("utf-8")
+
+    @classmethod
+    def synthetic(cls, players: int = 100, games_per_month: int = 30, start_date: str = "2025-01-01",
+                  end_date: Optional[datetime.date] = None, seed: int = 0, pgn_path: str = DEFAULT_PGN) -> "ChesscomFixtures":
+        """
+        Genera in modo deterministico leaderboard, profili, statistiche, archivi mensili
+        (da start_date al mese di end_date, default oggi) e avatar per `players` giocatori.
+        Tutti i giocatori compaiono nelle leaderboard, così fetch_chess_data li elabora tutti.
+        """
+        rng = random.Random(seed)
+        pgns = load_pgns(pgn_path)
+        end_date = end_date or datetime.date.today()
+        months = _months(datetime.date.fromisoformat(start_date), end_date)
+
+        fixtures = cls()
+        fixtures.players = synthetic_usernames(players)
+
+        leaderboards = {category: [] for category in LEADERBOARD_TYPES}
+        for i, username in enumerate(fixtures.players):
+            leaderboards[LEADERBOARD_TYPES[i % len(LEADERBOARD_TYPES)]].append(
+                {"username": username, "score": rng.randint(2000, 3300), "rank": i + 1}
+            )
+        fixtures.add_json("/pub/leaderboards", leaderboards)
+
+        for i, username in enumerate(fixtures.players):
+            profile = {
+                "avatar": f"{BASE_URL_TOKEN}/avatars/{username}.png",
+                "player_id": 100000 + i,
+                "@id": f"{BASE_URL_TOKEN}/pub/player/{username}",
+                "url": f"https://www.chess.com/member/{username}",
+                "name": f"Bench Player {i}",
+                "username": username,
+                "followers": rng.randint(0, 100000),
+                "country": "https://api.chess.com/pub/country/IT",
+                "location": "Benchmark",
+                "last_online": 1700000000 + i,
+                "joined": 1500000000 + i,
+                "status": "premium",
+            }
+            if i % 5 == 0:
+                profile["title"] = rng.choice(["GM", "IM", "FM"])
+            fixtures.add_json(f"/pub/player/{username}", profile)
+
+            stats = {}
+            for _, _, game_type in TIME_CLASSES:
+                rating = rng.randint(1200, 3200)
+                stats[game_type] = {
+                    "last": {"rating": rating, "date": 1700000000, "rd": 45},
+                    "best": {"rating": rating + rng.randint(0, 150), "date": 1690000000,
+                             "game": f"https://www.chess.com/game/live/{rng.randint(10**9, 10**10)}"},
+                    "record": {"win": rng.randint(0, 5000), "loss": rng.randint(0, 5000), "draw": rng.randint(0, 800)},
+                }
+            fixtures.add_json(f"/pub/player/{username}/stats", stats)
+
+            archives = []
+            for year, month in months:
+                archives.append(f"{BASE_URL_TOKEN}/pub/player/{username}/games/{year}/{month:02d}")
+                games = []
+                for day in sorted(rng.randint(1, 28) for _ in range(games_per_month)):
+                    time_class, time_control, _ = rng.choice(TIME_CLASSES)
+                    end_time = int(datetime.datetime(year, month, day, rng.randint(0, 23), rng.randint(0, 59),
+                                                     tzinfo=datetime.timezone.utc).timestamp())
+                    opponent = f"opponent{rng.randint(0, 99999):05d}"
+                    white, black = (username, opponent) if rng.random() < 0.5 else (opponent, username)
+                    white_result = rng.choice(["win", "resigned", "agreed", "timeout"])
+                    games.append({
+                        "url": f"https://www.chess.com/game/live/{rng.randint(10**9, 10**10)}",
+                        "pgn": rng.choice(pgns),
+                        "time_control": time_control,
+                        "end_time": end_time,
+                        "rated": True,
+                        "accuracies": {"white": round(rng.uniform(50, 99), 2), "black": round(rng.uniform(50, 99), 2)},
+                        "time_class": time_class,
+                        "rules": "chess",
+                        "white": {"rating": rng.randint(1200, 3200), "result": white_result, "username": white},
+                        "black": {"rating": rng.randint(1200, 3200), "result": "win" if white_result != "win" else "resigned",
+                                  "username": black},
+                        "eco": "https://www.chess.com/openings/Sicilian-Defense",
+                    })
+                games.sort(key=lambda game: game["end_time"])
+                fixtures.add_json(f"/pub/player/{username}/games/{year}/{month:02d}", {"games": games})
+            fixtures.add_json(f"/pub/player/{username}/games/archives", {"archives": archives})
+
+            # Un PNG minimo seguito da byte casuali: conta solo la dimensione
+            fixtures.responses[f"/avatars/{username}.png"] = b"\x89PNG\r\n\x1a\n" + rng.randbytes(4096)
+
+        return fixtures
+
+    @classmethod
+    def load_dir(cls, directory: str) -> "ChesscomFixtures":
+        """Carica le fixture registrate con `record` (un file per percorso, .json per le risposte JSON)."""
+        fixtures = cls()
+        for root, _, files in os.walk(directory):
+            for name in files:
+                full_path = os.path.join(root, name)
+                path = "/" + os.path.relpath(full_path, directory).replace(os.sep, "/")
+                if path.endswith(".json"):
+                    path = path[:-len(".json")]
+                with open(full_path, "rb") as f:
+                    fixtures.responses[path.lower()] = f.read()
+                match = re.fullmatch(r"/pub/player/([^/]+)", path.lower())
+                if match:
+                    fixtures.players.append(match.group(1))
+        fixtures.players.sort()
+        return fixtures
+
+
+def record(usernames: List[str], out_dir: str, start_date: str = "2025-01-01",
+           api_base: str = "https://api.chess.com/pub") -> None:
+    """
+    Scarica dall'API reale le risposte per i giocatori indicati e le salva in out_dir.
+    Gli URL degli avatar vengono riscritti verso il finto server.
+    """
+    import requests
+
+    session = requests.Session()
+    session.headers["User-Agent"] = "chess-data benchmark fixture recorder"
+    start = datetime.date.fromisoformat(start_date)
+
+    def save(path: str, content: bytes) -> None:
+        target = os.path.join(out_dir, path.lstrip("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(content)
+
+    def fetch_json(url: str):
+        time.sleep(0.2)  # l'API pubblica limita le richieste parallele
+        response = session.get(url, timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    leaderboards = fetch_json(f"{api_base}/leaderboards")
+    recorded = {username.lower() for username in usernames}
+    for category in LEADERBOARD_TYPES:
+        leaderboards[category] = [p for p in leaderboards.get(category, []) if p["username"].lower() in recorded]
+    save("/pub/leaderboards.json", json.dumps(leaderboards).encode("utf-8"))
+
+    for username in sorted(recorded):
+        profile = fetch_json(f"{api_base}/player/{username}")
+        avatar_url = profile.get("avatar")
+        if avatar_url:
+            save(f"/avatars/{username}.png", session.get(avatar_url, timeout=30).content)
+            profile["avatar"] = f"{BASE_URL_TOKEN}/avatars/{username}.png"
+        save(f"/pub/player/{username}.json", json.dumps(profile).encode("utf-8"))
+        save(f"/pub/player/{username}/stats.json", json.dumps(fetch_json(f"{api_base}/player/{username}/stats")).encode("utf-8"))
+
+        archives = fetch_json(f"{api_base}/player/{username}/games/archives").get("archives", [])
+        kept = []
+        for archive_url in archives:
+            year, month = (int(part) for part in archive_url.rstrip("/").split("/")[-2:])
+            if (year, month) < (start.year, start.month):
+                continue
+            kept.append(f"{BASE_URL_TOKEN}/pub/player/{username}/games/{year}/{month:02d}")
+            games = fetch_json(archive_url)
+            save(f"/pub/player/{username}/games/{year}/{month:02d}.json", json.dumps(games).encode("utf-8"))
+        save(f"/pub/player/{username}/games/archives.json", json.dumps({"archives": kept}).encode("utf-8"))
+        print(f"✅ Registrate le fixture di {username} ({len(kept)} mesi)")
+
+
+def _endpoint(path: str) -> str:
+    if path.startswith("/avatars/"):
+        return "avatar"
+    if path == "/pub/leaderboards":
+        return "leaderboards"
+    parts = path.split("/")
+    if len(parts) == 4:
+        return "profile"
+    if parts[-1] == "stats":
+        return "stats"
+    if parts[-1] == "archives":
+        return "archives"
+    if "games" in parts:
+        return "games"
+    return "other"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # connessioni keep-alive come l'API reale
+
+    def do_GET(self) -> None:
+        self.server.fake._handle(self)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class FakeChesscomServer:
+    """
+    Server HTTP locale che serve le fixture in un thread in background.
+    latency (+ jitter casuale) viene aggiunta a ogni risposta; una frazione error_rate
+    delle richieste all'API riceve 429 con Retry-After pari a retry_after secondi.
+    """
+
+    def __init__(self, fixtures: ChesscomFixtures, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, retry_after: int = 0, seed: int = 0,
+                 host: str = "127.0.0.1", port: int = 0) -> None:
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.host = host
+        self.port = port
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._bodies: Dict[str, bytes] = {}
+        self._etags: Dict[str, str] = {}
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self.reset_stats()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def api_base(self) -> str:
+        return f"{self.base_url}/pub"
+
+    def start(self) -> "FakeChesscomServer":
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self.port = self._httpd.server_address[1]
+
+        token, base_url = BASE_URL_TOKEN.encode(), self.base_url.encode()
+        for path, body in self.fixtures.responses.items():
+            body = body.replace(token, base_url)
+            self._bodies[path] = body
+            self._etags[path] = '"' + hashlib.md5(body).hexdigest() + '"'
+
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-chesscom", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self) -> "FakeChesscomServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._requests: Dict[str, int] = {}
+            self._statuses: Dict[int, int] = {}
+
+    def stats(self) -> Dict[str, Dict]:
+        """Richieste ricevute per endpoint e per status HTTP restituito."""
+        with self._lock:
+            return {
+                "total": sum(self._requests.values()),
+                "by_endpoint": dict(self._requests),
+                "by_status": dict(self._statuses),
+            }
+
+    def _handle(self, handler: BaseHTTPRequestHandler) -> None:
+        path = urllib.parse.urlsplit(handler.path).path.rstrip("/").lower()
+        endpoint = _endpoint(path)
+
+        with self._lock:
+            self._requests[endpoint] = self._requests.get(endpoint, 0) + 1
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            throttled = endpoint != "avatar" and self._rng.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+
+        body = self._bodies.get(path)
+        if throttled:
+            self._send(handler, 429, b'{"code":0,"message":"Too Many Requests"}', {"Retry-After": str(self.retry_after)})
+        elif body is None:
+            self._send(handler, 404, json.dumps({"code": 0, "message": f"Not found: {path}"}).encode("utf-8"))
+        elif handler.headers.get("If-None-Match") == self._etags[path]:
+            self._send(handler, 304, b"", {"ETag": self._etags[path]})
+        else:
+            content_type = "image/png" if endpoint == "avatar" else "application/json"
+            self._send(handler, 200, body, {
+                "Content-Type": content_type,
+                "ETag": self._etags[path],
+                "Last-Modified": LAST_MODIFIED,
+            })
+
+    def _send(self, handler: BaseHTTPRequestHandler, status: int, body: bytes,
+              headers: Optional[Dict[str, str]] = None) -> None:
+        with self._lock:
+            self._statuses[status] = self._statuses.get(status, 0) + 1
+        handler.send_response(status)
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        if status != 304:
+            handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        if status != 304:
+            handler.wfile.write(body)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="avvia il finto server")
+    serve.add_argument("--fixtures", help="directory di fixture registrate (default: sintetiche)")
+    serve.add_argument("--players", type=int, default=100)
+    serve.add_argument("--games-per-month", type=int, default=30)
+    serve.add_argument("--latency", type=float, default=0.0, help="secondi aggiunti a ogni risposta")
+    serve.add_argument("--jitter", type=float, default=0.0)
+    serve.add_argument("--error-rate", type=float, default=0.0, help="frazione di richieste con risposta 429")
+    serve.add_argument("--retry-after", type=int, default=0)
+    serve.add_argument("--port", type=int, default=8080)
+
+    rec = commands.add_parser("record", help="registra fixture dall'API reale")
+    rec.add_argument("usernames", nargs="+")
+    rec.add_argument("--out", default=os.path.join(os.path.dirname(__file__), "fixtures", "recorded"))
+    rec.add_argument("--start-date", default="2025-01-01")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args.usernames, args.out, args.start_date)
+        return
+
+    fixtures = ChesscomFixtures.load_dir(args.fixtures) if args.fixtures else \
+        ChesscomFixtures.synthetic(args.players, args.games_per_month)
+    server = FakeChesscomServer(fixtures, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                retry_after=args.retry_after, port=args.port).start()
+    print(f"🔹 Finto Chess.com su {server.api_base} ({len(fixtures.players)} giocatori). Ctrl+C per uscire.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps(server.stats(), indent=2))
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,500 @@
+"""
+Client Google Cloud in memoria per i benchmark.
+
+Implementano la parte delle API di Firestore, Cloud Storage, BigQuery e Cloud Logging
+usata da commons: registrati con install_fake_clients() al posto dei client reali,
+FirestoreConnection, BucketManager, BigQueryConnection e le pipeline funzionano
+senza credenziali né rete, con i dati tenuti nel processo.
+"""
+import copy
+import datetime
+import gzip
+import io
+import itertools
+import json
+import threading
+import uuid
+from contextlib import nullcontext
+from typing import Any, Dict, Iterable, List, Optional
+
+from google.cloud.firestore_v1 import transforms
+
+from commons import client_registry
+
+_MISSING = object()
+MAX_BATCH_WRITES = 500
+
+
+def _get_path(data: Optional[Dict[str, Any]], field_path: str) -> Any:
+    value = data
+    for part in field_path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _nest(field_path: str, value: Any) -> Dict[str, Any]:
+    """Trasforma "a.b.c" = value in {"a": {"b": {"c": value}}}."""
+    for part in reversed(field_path.split(".")[1:]):
+        value = {part: value}
+    return {field_path.split(".")[0]: value}
+
+
+def _apply(target: Dict[str, Any], updates: Dict[str, Any]) -> None:
+    """Applica una scrittura con merge, risolvendo i valori speciali di Firestore."""
+    for key, value in updates.items():
+        if value is transforms.DELETE_FIELD:
+            target.pop(key, None)
+        elif value is transforms.SERVER_TIMESTAMP:
+            target[key] = datetime.datetime.now(datetime.timezone.utc)
+        elif isinstance(value, transforms.ArrayUnion):
+            current = target.get(key) if isinstance(target.get(key), list) else []
+            target[key] = current + [v for v in value.values if v not in current]
+        elif isinstance(value, transforms.ArrayRemove):
+            current = target.get(key) if isinstance(target.get(key), list) else []
+            target[key] = [v for v in current if v not in value.values]
+        elif isinstance(value, transforms.Increment):
+            target[key] = (target.get(key) or 0) + value.value
+        elif isinstance(value, dict):
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            _apply(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+def _project(data: Dict[str, Any], fields: Iterable[str]) -> Dict[str, Any]:
+    projected: Dict[str, Any] = {}
+    for field_path in fields:
+        value = _get_path(data, field_path)
+        if value is not _MISSING:
+            _apply(projected, _nest(field_path, value))
+    return projected
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference: "FakeDocumentReference", data: Optional[Dict[str, Any]],
+                 fields: Optional[List[str]] = None) -> None:
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+        self._fields = fields
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        if self._data is None:
+            return None
+        if self._fields is not None:
+            return _project(self._data, self._fields)
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path: str) -> Any:
+        value = _get_path(self._data, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+
+class FakeDocumentReference:
+    def __init__(self, client: "FakeFirestoreClient", collection: str, document_id: str) -> None:
+        self._client = client
+        self._collection = collection
+        self.id = document_id
+
+    @property
+    def path(self) -> str:
+        return f"{self._collection}/{self.id}"
+
+    def get(self, field_paths: Optional[List[str]] = None) -> FakeDocumentSnapshot:
+        self._client.reads += 1
+        with self._client._lock:
+            data = copy.deepcopy(self._client._documents(self._collection).get(self.id))
+        return FakeDocumentSnapshot(self, data, field_paths)
+
+    def set(self, document_data: Dict[str, Any], merge: bool = False) -> None:
+        with self._client._lock:
+            self._client._set(self._collection, self.id, document_data, merge)
+
+    def update(self, field_updates: Dict[str, Any]) -> None:
+        with self._client._lock:
+            if self.id not in self._client._documents(self._collection):
+                raise KeyError(f"Documento inesistente: {self.path}")
+            self._client._update(self._collection, self.id, field_updates)
+
+    def delete(self) -> None:
+        with self._client._lock:
+            self._client.writes += 1
+            self._client._documents(self._collection).pop(self.id, None)
+
+
+class FakeQuery:
+    def __init__(self, client: "FakeFirestoreClient", collection: str, filters=(), orders=(),
+                 limit: Optional[int] = None, fields: Optional[List[str]] = None,
+                 start_after: Optional[FakeDocumentSnapshot] = None) -> None:
+        self._client = client
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._fields = fields
+        self._start_after = start_after
+
+    def _copy(self, **changes) -> "FakeQuery":
+        state = {
+            "filters": self._filters, "orders": self._orders, "limit": self._limit,
+            "fields": self._fields, "start_after": self._start_after,
+        }
+        state.update(changes)
+        return FakeQuery(self._client, self._collection, **state)
+
+    def select(self, field_paths: Iterable[str]) -> "FakeQuery":
+        return self._copy(fields=list(field_paths))
+
+    def where(self, field_path: str, op_string: str, value: Any) -> "FakeQuery":
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "FakeQuery":
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int) -> "FakeQuery":
+        return self._copy(limit=count)
+
+    def start_after(self, document: FakeDocumentSnapshot) -> "FakeQuery":
+        return self._copy(start_after=document)
+
+    @staticmethod
+    def _matches(data: Dict[str, Any], field_path: str, op: str, value: Any) -> bool:
+        current = _get_path(data, field_path)
+        if current is _MISSING:
+            return False
+        try:
+            if op == "==":
+                return current == value
+            if op == "!=":
+                return current != value
+            if op == "<":
+                return current < value
+            if op == "<=":
+                return current <= value
+            if op == ">":
+                return current > value
+            if op == ">=":
+                return current >= value
+            if op == "in":
+                return current in value
+            if op == "array_contains":
+                return isinstance(current, list) and value in current
+        except TypeError:
+            return False
+        raise ValueError(f"Operatore non supportato: {op}")
+
+    def stream(self):
+        with self._client._lock:
+            documents = copy.deepcopy(self._client._documents(self._collection))
+        rows = [(doc_id, data) for doc_id, data in documents.items()
+                if all(self._matches(data, *condition) for condition in self._filters)]
+
+        rows.sort(key=lambda row: row[0])
+        # Ordinamenti stabili applicati dall'ultimo al primo; i documenti senza il campo vengono esclusi come in Firestore
+        for field_path, direction in reversed(self._orders):
+            if field_path == "__name__":
+                rows.sort(key=lambda row: row[0], reverse=direction == "DESCENDING")
+                continue
+            rows = [row for row in rows if _get_path(row[1], field_path) is not _MISSING]
+            rows.sort(key=lambda row: _get_path(row[1], field_path), reverse=direction == "DESCENDING")
+
+        if self._start_after is not None:
+            ids = [doc_id for doc_id, _ in rows]
+            if self._start_after.id in ids:
+                rows = rows[ids.index(self._start_after.id) + 1:]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+
+        self._client.reads += len(rows)
+        for doc_id, data in rows:
+            yield FakeDocumentSnapshot(FakeDocumentReference(self._client, self._collection, doc_id), data, self._fields)
+
+    def get(self) -> List[FakeDocumentSnapshot]:
+        return list(self.stream())
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client: "FakeFirestoreClient", collection: str) -> None:
+        super().__init__(client, collection)
+        self.id = collection
+
+    def document(self, document_id: Optional[str] = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self._client, self._collection, document_id or uuid.uuid4().hex)
+
+
+class FakeWriteBatch:
+    def __init__(self, client: "FakeFirestoreClient") -> None:
+        self._client = client
+        self._writes: List[tuple] = []
+
+    def set(self, reference: FakeDocumentReference, document_data: Dict[str, Any], merge: bool = False) -> None:
+        self._writes.append(("set", reference, document_data, merge))
+
+    def update(self, reference: FakeDocumentReference, field_updates: Dict[str, Any]) -> None:
+        self._writes.append(("update", reference, field_updates, True))
+
+    def delete(self, reference: FakeDocumentReference) -> None:
+        self._writes.append(("delete", reference, None, False))
+
+    def commit(self) -> list:
+        if len(self._writes) > MAX_BATCH_WRITES:
+            raise ValueError(f"Una batch accetta al massimo {MAX_BATCH_WRITES} scritture ({len(self._writes)})")
+        with self._client._lock:
+            self._client.batches += 1
+            for op, reference, data, merge in self._writes:
+                if op == "set":
+                    self._client._set(reference._collection, reference.id, data, merge)
+                elif op == "update":
+                    self._client._update(reference._collection, reference.id, data)
+                else:
+                    self._client.writes += 1
+                    self._client._documents(reference._collection).pop(reference.id, None)
+        results, self._writes = self._writes, []
+        return results
+
+
+class FakeFirestoreClient:
+    """Firestore in memoria: collection → {document id → dati}. Conta letture, scritture e batch."""
+
+    def __init__(self) -> None:
+        self._data: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.RLock()
+        self.reads = 0
+        self.writes = 0
+        self.batches = 0
+
+    def _documents(self, collection: str) -> Dict[str, Dict[str, Any]]:
+        return self._data.setdefault(collection, {})
+
+    def _set(self, collection: str, document_id: str, data: Dict[str, Any], merge: bool) -> None:
+        self.writes += 1
+        documents = self._documents(collection)
+        target = documents.get(document_id, {}) if merge else {}
+        if isinstance(merge, list):
+            # merge=[campi]: i campi indicati vengono sostituiti per intero
+            for field_path in merge:
+                parent_path, _, name = field_path.rpartition(".")
+                parent = _get_path(target, parent_path) if parent_path else target
+                if isinstance(parent, dict):
+                    parent.pop(name, None)
+        _apply(target, data)
+        documents[document_id] = target
+
+    def _update(self, collection: str, document_id: str, field_updates: Dict[str, Any]) -> None:
+        self.writes += 1
+        target = self._documents(collection).setdefault(document_id, {})
+        for field_path, value in field_updates.items():
+            if isinstance(value, dict):
+                # Con update() una mappa sostituisce il campo indicato invece di essere unita
+                parent_path, _, name = field_path.rpartition(".")
+                parent = _get_path(target, parent_path) if parent_path else target
+                if isinstance(parent, dict):
+                    parent.pop(name, None)
+            _apply(target, _nest(field_path, value))
+
+    def collection(self, name: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self, name)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def count(self, collection: str) -> int:
+        with self._lock:
+            return len(self._documents(collection))
+
+
+class FakeBlob:
+    def __init__(self, bucket: "FakeBucket", name: str) -> None:
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def size(self) -> Optional[int]:
+        data = self.bucket._objects.get(self.name)
+        return len(data) if data is not None else None
+
+    @property
+    def public_url(self) -> str:
+        return f"https://storage.googleapis.com/{self.bucket.name}/{self.name}"
+
+    def exists(self) -> bool:
+        return self.name in self.bucket._objects
+
+    def upload_from_string(self, data, content_type: Optional[str] = None) -> None:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.bucket._put(self.name, bytes(data))
+
+    def upload_from_filename(self, filename: str, content_type: Optional[str] = None) -> None:
+        with open(filename, "rb") as f:
+            self.bucket._put(self.name, f.read())
+
+    def upload_from_file(self, file_obj, content_type: Optional[str] = None) -> None:
+        self.bucket._put(self.name, file_obj.read())
+
+    def download_as_bytes(self) -> bytes:
+        data = self.bucket._objects.get(self.name)
+        if data is None:
+            raise FileNotFoundError(f"gs://{self.bucket.name}/{self.name}")
+        return data
+
+    def download_to_filename(self, filename: str) -> None:
+        with open(filename, "wb") as f:
+            f.write(self.download_as_bytes())
+
+    def delete(self) -> None:
+        with self.bucket._lock:
+            self.bucket._objects.pop(self.name, None)
+
+
+class FakeBucket:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._objects: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+        self.bytes_uploaded = 0
+
+    def _put(self, name: str, data: bytes) -> None:
+        with self._lock:
+            self._objects[name] = data
+            self.bytes_uploaded += len(data)
+
+    def exists(self) -> bool:
+        return True
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(self, name)
+
+    def list_blobs(self, prefix: Optional[str] = None) -> List[FakeBlob]:
+        with self._lock:
+            names = sorted(self._objects)
+        return [FakeBlob(self, name) for name in names if not prefix or name.startswith(prefix)]
+
+
+class FakeStorageClient:
+    def __init__(self) -> None:
+        self._buckets: Dict[str, FakeBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, name: str) -> FakeBucket:
+        with self._lock:
+            return self._buckets.setdefault(name, FakeBucket(name))
+
+    def list_blobs(self, bucket_or_name, prefix: Optional[str] = None) -> List[FakeBlob]:
+        name = bucket_or_name if isinstance(bucket_or_name, str) else bucket_or_name.name
+        return self.bucket(name).list_blobs(prefix=prefix)
+
+    def batch(self):
+        # Le eliminazioni in memoria non hanno bisogno di essere raggruppate
+        return nullcontext()
+
+    def read_uri(self, uri: str) -> bytes:
+        bucket_name, _, blob_name = uri[len("gs://"):].partition("/")
+        return self.bucket(bucket_name).blob(blob_name).download_as_bytes()
+
+
+class FakeJob:
+    _ids = itertools.count(1)
+
+    def __init__(self, output_rows: int = 0, rows: Optional[List[Dict[str, Any]]] = None) -> None:
+        self.job_id = f"fake_job_{next(self._ids)}"
+        self.output_rows = output_rows
+        self.errors = None
+        self._rows = rows or []
+        self.total_rows = len(self._rows)
+
+    def result(self, timeout: Optional[float] = None) -> "FakeJob":
+        return self
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+class FakeBigQueryClient:
+    """
+    BigQuery in memoria: i load job leggono i file NDJSON (anche gzip) dal finto Cloud Storage
+    e contano le righe caricate per tabella. Con keep_rows=True le righe vengono anche conservate.
+    Le query ritornano un risultato vuoto.
+    """
+
+    def __init__(self, storage_client: FakeStorageClient, keep_rows: bool = False) -> None:
+        self.storage_client = storage_client
+        self.keep_rows = keep_rows
+        self.loaded_rows: Dict[str, int] = {}
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.load_jobs = 0
+        self.queries: List[str] = []
+        self._lock = threading.Lock()
+
+    def _load(self, table: str, lines: Iterable[bytes]) -> FakeJob:
+        rows = [json.loads(line) for line in lines if line.strip()]
+        with self._lock:
+            self.load_jobs += 1
+            self.loaded_rows[table] = self.loaded_rows.get(table, 0) + len(rows)
+            if self.keep_rows:
+                self.tables.setdefault(table, []).extend(rows)
+        return FakeJob(output_rows=len(rows))
+
+    def load_table_from_uri(self, source_uris, destination: str, job_config=None) -> FakeJob:
+        if isinstance(source_uris, str):
+            source_uris = [source_uris]
+        lines: List[bytes] = []
+        for uri in source_uris:
+            data = self.storage_client.read_uri(uri)
+            if uri.endswith(".gz"):
+                data = gzip.decompress(data)
+            lines.extend(data.splitlines())
+        return self._load(str(destination), lines)
+
+    def load_table_from_file(self, file_obj, destination: str, job_config=None) -> FakeJob:
+        data = file_obj.read()
+        if data[:2] == b"\x1f\x8b":
+            data = gzip.decompress(data)
+        return self._load(str(destination), data.splitlines())
+
+    def load_table_from_json(self, json_rows: List[Dict[str, Any]], destination: str, job_config=None) -> FakeJob:
+        buffer = io.BytesIO("\n".join(json.dumps(row, default=str) for row in json_rows).encode("utf-8"))
+        return self.load_table_from_file(buffer, destination, job_config)
+
+    def query(self, sql: str, job_config=None) -> FakeJob:
+        with self._lock:
+            self.queries.append(sql)
+        return FakeJob()
+
+
+class FakeLogger:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.entries = 0
+
+    def log_text(self, text: str, severity: Optional[str] = None, **kwargs) -> None:
+        self.entries += 1
+
+
+class FakeLoggingClient:
+    def logger(self, name: str) -> FakeLogger:
+        return FakeLogger(name)
+
+
+class FakeCredentials:
+    project_id = "benchmark"
+
+
+def install_fake_clients(keep_rows: bool = False) -> Dict[str, Any]:
+    """Registra i client in memoria nel client_registry e li ritorna per chiave."""
+    storage_client = FakeStorageClient()
+    clients = {
+        "credentials": FakeCredentials(),
+        "firestore": FakeFirestoreClient(),
+        "storage": storage_client,
+        "bigquery": FakeBigQueryClient(storage_client, keep_rows=keep_rows),
+        "logging": FakeLoggingClient(),
+    }
+    client_registry.override_clients(**clients)
+    return clients
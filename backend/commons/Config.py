@@ -1,14 +1,60 @@
 
-from google.cloud import logging as cloud_logging
+import os
+from commons.client_registry import get_logger
 
 class Config:
     PROJECT = "chess-data-451709"
     BUCKET_NAME_AVATARS = f"{PROJECT}-chesscom-avatars"
     BUCKET_UPLOAD_DATA = "chesscom-games-data"
-    CHESSCOM_API_BASE = "https://api.chess.com/pub"
+    CHESSCOM_API_BASE = os.environ.get("CHESSCOM_API_BASE", "https://api.chess.com/pub")
     FIRESTORE_CHESSCOM_USERS_COLLECTION =  "chesscom_users"
+    FIRESTORE_LEADERBOARDS_COLLECTION = "chesscom_leaderboards"
+    FIRESTORE_PIPELINE_STATE_COLLECTION = "pipeline_state"
+    # Statistiche per tipo di partita salvate sui documenti dei giocatori
+    GAME_TYPES = ["chess_blitz", "chess_bullet", "chess_rapid", "chess_daily", "chess960_daily"]
+    LEADERBOARD_SNAPSHOT_SIZE = 200
     BQ_DATASET_CHESSCOM = "chesscom"
-    REQUEST_DELAY = 0.5
+    REQUEST_RATE = 8  # richieste al secondo verso l'API di Chess.com
+    REQUEST_BURST = 8
+    FETCH_CONCURRENCY = 8
+    HTTP_POOL_SIZE = 32
+    HTTP_MAX_RETRIES = 5
+    HTTP_BACKOFF_FACTOR = 0.5  # attese di 0.5s, 1s, 2s, ... tra i retry
+    HTTP_DEFAULT_TIMEOUT = 10
+    HTTP_TIMEOUTS = {
+        "leaderboards": 15,
+        "profile": 10,
+        "stats": 10,
+        "archives": 10,
+        "games": 30,
+        "avatar": 10,
+    }
+    GCS_TRANSFER_WORKERS = 16  # thread per upload/download paralleli sui bucket
+    AVATAR_UPLOAD_WORKERS = 8
+    CACHE_MAX_ENTRIES = 1024
+    CACHE_TTL_SEARCH = 300  # secondi
+    CACHE_TTL_TOP_PLAYERS = 600
+    CACHE_TTL_PLAYER_HISTORY = 3600
+    CACHE_TTL_PLAYER_OPENINGS = 600
+    CACHE_TTL_HISTORY_GENERATION = 30  # ogni quanto rileggere l'ultima esecuzione dello snapshot
+    CACHE_TTL_PLAYER_GENERATION = 30  # ogni quanto rileggere la versione del documento di un giocatore
+    GAMES_START_DATE = "2025-01-01"
+    STAGING_MAX_ROWS = 50000  # righe per file NDJSON di staging
+    FIRESTORE_BATCH_SIZE = 500  # scritture per WriteBatch
+    EXPORT_PAGE_SIZE = 500  # documenti letti per pagina nell'export verso BigQuery
+    MAX_URIS_PER_LOAD_JOB = 10000  # limite di BigQuery per load job
+    GAMES_SHARDS = 8  # shard dei giocatori nel DAG chesscom_fetch_games
+    AIRFLOW_CHESSCOM_POOL = "chesscom_api"  # pool Airflow che limita i task concorrenti verso Chess.com
+    ARCHIVE_CACHE_DIR = os.environ.get("CHESSCOM_ARCHIVE_CACHE_DIR", "/tmp/chesscom_archive_cache")
+    # Esportazione delle metriche Prometheus a fine run (disattivata se non configurata)
+    METRICS_TEXTFILE_DIR = os.environ.get("CHESSCOM_METRICS_DIR")
+    METRICS_PUSHGATEWAY_URL = os.environ.get("CHESSCOM_PUSHGATEWAY_URL")
+    # Archivio Parquet locale delle partite interrogato con DuckDB (disattivato se non configurato;
+    # duckdb è opzionale e va installato a parte: pip install duckdb)
+    LOCAL_GAME_STORE_DIR = os.environ.get("CHESSCOM_LOCAL_GAME_STORE_DIR")
+    # Indice SQLite delle posizioni (hash di Zobrist) raggiunte dalle partite (disattivato se non configurato)
+    POSITION_INDEX_PATH = os.environ.get("CHESSCOM_POSITION_INDEX_PATH")
+    POSITION_INDEX_MAX_PLY = 30
     HEADERS = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
     }
@@ -19,5 +65,4 @@ class Config:
     
     @staticmethod
     def init_logging():
-        logging_client = cloud_logging.Client()
-        return logging_client.logger('chess_data_collector')
\ No newline at end of file
+        return get_logger('chess_data_collector')
\ No newline at end of file
@@ -0,0 +1,78 @@
+import gzip
+import json
+import os
+from typing import Optional, Dict, Any, List
+
+
+class ArchiveCache:
+    """
+    Cache su disco degli archivi mensili delle partite di Chess.com.
+    Per ogni giocatore e mese conserva le partite, ETag e Last-Modified
+    e se il mese è già stato caricato completamente.
+    """
+
+    def __init__(self, cache_dir: str) -> None:
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, player: str, year: int, month: int) -> str:
+        return os.path.join(self.cache_dir, player.lower(), f"{year}-{month:02d}.json.gz")
+
+    def get(self, player: str, year: int, month: int) -> Optional[Dict[str, Any]]:
+        """Ritorna la voce in cache per il mese indicato, oppure None."""
+        path = self._path(player, year, month)
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Voce corrotta (es. scrittura interrotta): la trattiamo come assente
+            return None
+
+    def _write(self, player: str, year: int, month: int, entry: Dict[str, Any]) -> None:
+        path = self._path(player, year, month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def put(self, player: str, year: int, month: int, games: List[Dict[str, Any]],
+            etag: Optional[str], last_modified: Optional[str]) -> None:
+        """Salva le partite di un mese insieme ai validatori HTTP della risposta."""
+        self._write(player, year, month, {
+            "etag": etag,
+            "last_modified": last_modified,
+            "complete": False,
+            "games": games,
+        })
+
+    def is_complete(self, player: str, year: int, month: int) -> bool:
+        entry = self.get(player, year, month)
+        return bool(entry and entry.get("complete"))
+
+    def mark_complete(self, player: str, year: int, month: int) -> None:
+        """
+        Segna un mese chiuso come caricato: non verrà più richiesto né analizzato.
+        Se il mese non è in cache (scaricato da un altro worker) viene salvata una voce vuota.
+        """
+        entry = self.get(player, year, month) or {"etag": None, "last_modified": None}
+        if entry.get("complete"):
+            return
+        entry["complete"] = True
+        # Le partite di un mese completo non servono più
+        entry["games"] = []
+        self._write(player, year, month, entry)
+
+    @staticmethod
+    def conditional_headers(entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        """Header per la richiesta condizionale a partire da una voce in cache."""
+        if not entry:
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
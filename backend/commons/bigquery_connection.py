@@ -1,28 +1,18 @@
 from google.cloud import bigquery
-from google.oauth2 import service_account
-import json
-import os
+from commons.client_registry import get_credentials, get_bigquery_client
 
 class BigQueryConnection():
-    def __init__(self):
-        BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # Ottiene la directory del file corrente
-        CREDENTIALS_PATH = os.path.join(BASE_DIR,  "be_credentials.json")
+    @property
+    def credentials(self):
+        return get_credentials()
 
-        with open(CREDENTIALS_PATH, 'r') as json_file:
-            service_account_info = json.load(json_file)
-        self.credentials = service_account.Credentials.from_service_account_info(
-            service_account_info,
-            scopes=["https://www.googleapis.com/auth/cloud-platform"],
-        )
-        
-        self.connection = self.connect_to_bigquery()
+    @property
+    def connection(self):
+        return self.connect_to_bigquery()
 
     def connect_to_bigquery(self):
-        # Crea una connessione a BigQuery
-        return bigquery.Client(
-                credentials = self.credentials,
-                project = self.credentials.project_id,
-            )
+        # Il client BigQuery è condiviso da tutto il processo e ricreato dopo un fork
+        return get_bigquery_client()
         
     def execute_query(self, sql, params=None):
         try:
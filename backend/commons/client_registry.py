@@ -0,0 +1,113 @@
+"""
+Registro dei client Google Cloud condivisi dal processo.
+
+Ogni client viene creato alla prima richiesta e poi riutilizzato da tutte le
+connessioni (BigQueryConnection, FirestoreConnection, BucketManager, logging).
+Dopo un fork i client ereditati dal processo padre vengono scartati e
+ricreati al primo uso nel processo figlio. Per questo le connessioni e i logger
+non conservano il client: lo richiedono al registro a ogni utilizzo.
+"""
+import json
+import os
+import threading
+from typing import Any, Callable, Dict
+from google.cloud import bigquery, firestore, storage, logging as cloud_logging
+from google.oauth2 import service_account
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # Ottiene la directory del file corrente
+CREDENTIALS_PATH = os.path.join(BASE_DIR, "be_credentials.json")
+
+_clients: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def _get(name: str, factory: Callable[[], Any]) -> Any:
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = factory()
+                _clients[name] = client
+    return client
+
+
+def _load_credentials() -> service_account.Credentials:
+    with open(CREDENTIALS_PATH, 'r') as json_file:
+        service_account_info = json.load(json_file)
+    return service_account.Credentials.from_service_account_info(
+        service_account_info,
+        scopes=["https://www.googleapis.com/auth/cloud-platform"],
+    )
+
+
+def get_credentials() -> service_account.Credentials:
+    """Credenziali del service account lette una sola volta da be_credentials.json."""
+    return _get("credentials", _load_credentials)
+
+
+def get_bigquery_client() -> bigquery.Client:
+    def factory():
+        credentials = get_credentials()
+        return bigquery.Client(credentials=credentials, project=credentials.project_id)
+    return _get("bigquery", factory)
+
+
+def get_firestore_client() -> firestore.Client:
+    def factory():
+        credentials = get_credentials()
+        return firestore.Client(credentials=credentials, project=credentials.project_id)
+    return _get("firestore", factory)
+
+
+def get_storage_client() -> storage.Client:
+    return _get("storage", storage.Client)
+
+
+def get_logging_client() -> cloud_logging.Client:
+    return _get("logging", cloud_logging.Client)
+
+
+class RegistryLogger:
+    """
+    Logger Cloud Logging che risolve il client dal registro a ogni chiamata:
+    un logger creato all'import resta valido anche nei processi figli dopo un fork.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(get_logging_client().logger(self.name), attr)
+
+
+def get_logger(name: str) -> RegistryLogger:
+    return RegistryLogger(name)
+
+
+def override_clients(**clients: Any) -> None:
+    """
+    Registra client forniti dal chiamante al posto di quelli Google Cloud
+    (chiavi: credentials, bigquery, firestore, storage, logging), ad esempio
+    le implementazioni in memoria dei benchmark. Connessioni e logger già creati
+    useranno i nuovi client dalla chiamata successiva.
+    """
+    with _lock:
+        _clients.update(clients)
+
+
+def reset_clients() -> None:
+    """Scarta tutti i client: verranno ricreati al prossimo utilizzo."""
+    with _lock:
+        _clients.clear()
+
+
+def _reinit_after_fork() -> None:
+    global _lock
+    # Il lock potrebbe essere stato ereditato mentre era acquisito da un altro thread del padre
+    _lock = threading.Lock()
+    _clients.clear()
+
+
+# I client gRPC/HTTP non sono fork-safe: i worker (es. gunicorn, Airflow) li ricreano
+os.register_at_fork(after_in_child=_reinit_after_fork)
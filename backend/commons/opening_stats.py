@@ -0,0 +1,109 @@
+"""
+Statistiche per apertura di un giocatore.
+
+Le aperture sono identificate dallo slug del campo `eco` delle partite di Chess.com
+(es. https://www.chess.com/openings/Sicilian-Defense-Open → Sicilian-Defense-Open).
+La colonna eco di chess_games contiene l'URL completo: per confrontarla con le chiavi
+va convertita con opening_key, come fa pipelines/backfill_player_openings.py. Per ogni apertura e colore
+vengono contate partite, vittorie, sconfitte, patte e la somma delle accuracy,
+così gli aggregati si possono sommare con firestore.Increment man mano che arrivano partite.
+Il campo openings dei giocatori è escluso dagli indici Firestore (terraform/firestore.tf).
+"""
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+COLORS = ("white", "black")
+COUNTERS = ("games", "win", "loss", "draw", "accuracy_sum", "accuracy_games")
+# Risultati di Chess.com che indicano una patta (gli altri, tranne "win", sono sconfitte)
+DRAW_RESULTS = {"agreed", "repetition", "stalemate", "insufficient", "50move", "timevsinsufficient"}
+UNKNOWN_OPENING = "Unknown"
+
+Aggregates = Dict[str, Dict[str, Dict[str, float]]]
+
+
+def opening_key(eco_url: Optional[str]) -> str:
+    """
+    Slug dell'apertura ricavato dall'URL eco, usabile come chiave di una mappa Firestore:
+    i caratteri diversi da lettere, cifre e "-" (es. ".") diventano "_".
+    """
+    if not eco_url:
+        return UNKNOWN_OPENING
+    slug = eco_url.rstrip("/").rsplit("/", 1)[-1]
+    return re.sub(r"[^A-Za-z0-9-]", "_", slug) or UNKNOWN_OPENING
+
+
+def outcome(result: Optional[str]) -> str:
+    if result == "win":
+        return "win"
+    if result in DRAW_RESULTS:
+        return "draw"
+    return "loss"
+
+
+def add_game(aggregates: Aggregates, player: str, game: Dict[str, Any]) -> None:
+    """Aggiunge agli aggregati una partita di Chess.com dal punto di vista di player."""
+    player = player.lower()
+    color = next((c for c in COLORS if (game.get(c, {}).get("username") or "").lower() == player), None)
+    if color is None:
+        return
+
+    counters = aggregates.setdefault(opening_key(game.get("eco")), {}).setdefault(color, dict.fromkeys(COUNTERS, 0))
+    counters["games"] += 1
+    counters[outcome(game[color].get("result"))] += 1
+    accuracy = (game.get("accuracies") or {}).get(color)
+    if accuracy is not None:
+        counters["accuracy_sum"] += accuracy
+        counters["accuracy_games"] += 1
+
+
+def merge(target: Aggregates, source: Aggregates) -> Aggregates:
+    """Somma gli aggregati di source in target."""
+    for key, colors in source.items():
+        for color, counters in colors.items():
+            merged = target.setdefault(key, {}).setdefault(color, dict.fromkeys(COUNTERS, 0))
+            for name in COUNTERS:
+                merged[name] += counters.get(name, 0)
+    return target
+
+
+def as_increments(aggregates: Aggregates, increment: Callable[[float], Any]) -> Aggregates:
+    """Converte gli aggregati in una mappa di increment (es. firestore.Increment) da scrivere con merge."""
+    return {
+        key: {color: {name: increment(value) for name, value in counters.items() if value}
+              for color, counters in colors.items()}
+        for key, colors in aggregates.items()
+    }
+
+
+def summarize(aggregates: Aggregates, color: Optional[str] = None, opening: Optional[str] = None,
+              limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Righe per apertura e colore ordinate per numero di partite, con punteggio
+    ((vittorie + patte/2) / partite) e accuracy media. opening filtra le aperture
+    il cui nome contiene il testo indicato (es. "sicilian").
+    """
+    needle = opening.lower().replace(" ", "-") if opening else None
+    rows = []
+    for key, colors in aggregates.items():
+        if needle and needle not in key.lower():
+            continue
+        for row_color, counters in colors.items():
+            if color and row_color != color:
+                continue
+            games = counters.get("games", 0)
+            if not games:
+                continue
+            accuracy_games = counters.get("accuracy_games", 0)
+            rows.append({
+                "opening": key,
+                "name": key.replace("-", " "),
+                "color": row_color,
+                "games": games,
+                "win": counters.get("win", 0),
+                "loss": counters.get("loss", 0),
+                "draw": counters.get("draw", 0),
+                "score": round((counters.get("win", 0) + counters.get("draw", 0) / 2) / games, 4),
+                "avg_accuracy": round(counters["accuracy_sum"] / accuracy_games, 2) if accuracy_games else None,
+            })
+    rows.sort(key=lambda row: (-row["games"], row["opening"], row["color"]))
+    return rows[:limit] if limit else rows
@@ -0,0 +1,159 @@
+"""
+Indice su disco delle posizioni raggiunte dalle partite, per rispondere a
+"quali partite di questo giocatore arrivano a questa posizione" senza rigiocarle.
+
+Ogni partita viene rigiocata fino a max_ply semimosse: l'hash di Zobrist di ogni
+posizione (commons.zobrist) punta al game_id in un database SQLite. Colore, vincitore
+ed end_time sono ripetuti nella tabella positions, ordinata per (hash, player, end_time):
+statistiche e ultime partite di un giocatore si leggono da un solo intervallo della
+chiave primaria, senza join su tutte le partite trovate.
+Le partite indicizzate più volte non creano duplicati.
+"""
+import datetime
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from commons import pgn_tokenizer, zobrist
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS games (
+        game_id TEXT PRIMARY KEY,
+        white TEXT,
+        black TEXT,
+        rating_white INTEGER,
+        rating_black INTEGER,
+        winner TEXT,
+        time_class TEXT,
+        end_time REAL,
+        url TEXT
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS positions (
+        hash INTEGER NOT NULL,
+        player TEXT NOT NULL,
+        end_time REAL NOT NULL,
+        game_id TEXT NOT NULL,
+        ply INTEGER NOT NULL,
+        color TEXT NOT NULL,
+        winner TEXT NOT NULL,
+        PRIMARY KEY (hash, player, end_time, game_id)
+    ) WITHOUT ROWID;
+"""
+
+_GAME_COLUMNS = "g.game_id, g.url, g.white, g.black, g.rating_white, g.rating_black, g.winner, g.time_class, g.end_time"
+
+
+def _signed(h: int) -> int:
+    # SQLite salva interi a 64 bit con segno
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+
+def _winner(row: Dict[str, Any]) -> str:
+    if row.get("result_white") == "win":
+        return "white"
+    if row.get("result_black") == "win":
+        return "black"
+    return "draw"
+
+
+class PositionIndex:
+    """Indice hash di Zobrist → partite, salvato in un file SQLite."""
+
+    def __init__(self, path: str, max_ply: int = 30) -> None:
+        self.path = path
+        self.max_ply = max_ply
+        # Una connessione condivisa protetta da lock: le operazioni sono brevi
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            # WAL: un processo può leggere mentre un altro scrive
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def add_games(self, rows: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Indicizza righe di chess_games (game_id, user_id, giocatori, risultati, moves, ...).
+        moves può contenere anche i numeri di mossa ("1. e4 1... e5"), come nelle righe
+        caricate prima dell'estrazione delle sole mosse SAN.
+        Le partite con una mossa illegale nelle prime max_ply semimosse vengono saltate.
+        Ritorna il numero di partite indicizzate e saltate.
+        """
+        games, positions = [], []
+        skipped = 0
+        for row in rows:
+            try:
+                moves = pgn_tokenizer.tokenize_moves(row.get("moves") or "")
+                hashes = zobrist.position_hashes(moves, self.max_ply)
+            except ValueError:
+                skipped += 1
+                continue
+            winner = _winner(row)
+            games.append((
+                row["game_id"], row.get("white_player"), row.get("black_player"),
+                row.get("rating_white"), row.get("rating_black"), winner,
+                row.get("time_class"), row["end_time"], row.get("url"),
+            ))
+            player = row["user_id"].lower()
+            color = "white" if (row.get("white_player") or "").lower() == player else "black"
+            # In caso di ripetizione resta la prima semimossa in cui la posizione compare
+            seen = set()
+            for ply, h in enumerate(hashes):
+                if h not in seen:
+                    seen.add(h)
+                    positions.append((_signed(h), player, row["end_time"], row["game_id"], ply, color, winner))
+
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", games)
+            self._conn.executemany("INSERT OR IGNORE INTO positions VALUES (?, ?, ?, ?, ?, ?, ?)", positions)
+        return {"indexed": len(games), "skipped": skipped}
+
+    def search(self, fen: str, player: Optional[str] = None, limit: int = 50, offset: int = 0) -> Dict[str, Any]:
+        """
+        Partite che raggiungono la posizione del FEN (entro max_ply), dalla più recente,
+        e statistiche dei risultati: vittorie del bianco, patte e vittorie del nero e, se è
+        indicato player, vittorie, sconfitte e punteggio dal suo punto di vista.
+        Solleva ValueError se il FEN non è valido.
+        """
+        position_hash = zobrist.fen_hash(fen)
+        params: List[Any] = [_signed(position_hash)]
+        if player:
+            params.append(player.lower())
+            # Una riga per partita: l'intervallo (hash, player) è già ordinato per end_time
+            matches = "SELECT * FROM positions WHERE hash = ? AND player = ?"
+        else:
+            # Una partita tra due giocatori indicizzati compare una volta per ciascuno
+            matches = "SELECT * FROM positions WHERE hash = ? GROUP BY game_id"
+
+        stats_sql = f"""
+            SELECT count(*) AS games,
+                   coalesce(sum(winner = 'white'), 0) AS white_win,
+                   coalesce(sum(winner = 'draw'), 0) AS draw,
+                   coalesce(sum(winner = 'black'), 0) AS black_win,
+                   coalesce(sum(winner = color), 0) AS win
+            FROM ({matches})
+        """
+        games_sql = f"""
+            SELECT {_GAME_COLUMNS}, p.ply, p.color
+            FROM ({matches} ORDER BY end_time DESC LIMIT ? OFFSET ?) p
+            JOIN games g ON g.game_id = p.game_id
+            ORDER BY p.end_time DESC
+        """
+        with self._lock:
+            stats = dict(self._conn.execute(stats_sql, params).fetchone())
+            games = [dict(row) for row in self._conn.execute(games_sql, params + [limit, offset])]
+
+        if player:
+            stats["loss"] = stats["games"] - stats["win"] - stats["draw"]
+            stats["score"] = round((stats["win"] + stats["draw"] / 2) / stats["games"], 4) if stats["games"] else None
+        else:
+            del stats["win"]
+
+        for game in games:
+            game["end_time"] = datetime.datetime.utcfromtimestamp(game["end_time"])
+            color = game.pop("color")
+            if player:
+                game["color"] = color
+                game["outcome"] = "draw" if game["winner"] == "draw" else ("win" if game["winner"] == color else "loss")
+        return {"hash": f"{position_hash:016x}", "stats": stats, "games": games}
@@ -0,0 +1,20 @@
+import hashlib
+from typing import List
+
+
+def player_shard(player: str, num_shards: int) -> int:
+    """
+    Shard di un giocatore calcolato da un hash stabile dello username:
+    a differenza di hash() non cambia tra processi, quindi ogni giocatore
+    finisce sempre nello stesso shard.
+    """
+    digest = hashlib.md5(player.lower().encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % num_shards
+
+
+def shard_players(players: List[str], num_shards: int) -> List[List[str]]:
+    """Divide i giocatori in num_shards gruppi; gli shard vuoti vengono scartati."""
+    shards: List[List[str]] = [[] for _ in range(max(num_shards, 1))]
+    for player in players:
+        shards[player_shard(player, len(shards))].append(player)
+    return [shard for shard in shards if shard]
@@ -1,5 +1,9 @@
 from pathlib import Path
+import asyncio
+import datetime
 import sys
+from decimal import Decimal
+from typing import Optional
 
 current_dir = Path(__file__).resolve().parent
 
@@ -8,14 +12,54 @@ project_root = current_dir.parent
 print(f"project_root: {project_root}")
 
 sys.path.append(str(project_root))
+sys.path.append(str(current_dir))
 
-from fastapi import FastAPI, Response
+import orjson
+from fastapi import FastAPI, Response, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from backend.bigquery_connection import BigQueryConnection
-from backend.firestore_connection import FirestoreConnection
-from pipelines.fetch_chess_data.chess_data_collector import ChessDataCollector
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from commons.bigquery_connection import BigQueryConnection
+from commons.firestore_connection import FirestoreConnection
+from commons.chesscom_data_collector import ChesscomDataCollector
+from commons.http_client import get_http_client
+from commons.response_cache import ResponseCache
+from commons.downsampling import lttb, player_history_sql
+from commons import opening_stats
+from commons.Config import Config
 
-app = FastAPI()
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # brotli-asgi è opzionale: senza, le risposte vengono compresse con gzip
+    BrotliMiddleware = None
+
+
+def _json_default(value):
+    # Firestore ritorna DatetimeWithNanoseconds, una sottoclasse di datetime che orjson non serializza
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Tipo non serializzabile in JSON: {type(value).__name__}")
+
+
+class FastJSONResponse(ORJSONResponse):
+    """
+    Risposta JSON serializzata con orjson. Se ritornata direttamente da un endpoint
+    evita anche il passaggio di FastAPI per jsonable_encoder.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def to_columns(rows: list) -> dict:
+    """Converte una lista di dizionari in un dizionario di liste, una per campo."""
+    fields = list(rows[0].keys()) if rows else []
+    return {field: [row.get(field) for row in rows] for field in fields}
+
+
+app = FastAPI(default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,44 +69,94 @@ app.add_middleware(
     allow_headers=["Authorization", "Content-Type"],  
 )
 
+if BrotliMiddleware:
+    app.add_middleware(BrotliMiddleware, minimum_size=1000, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
+
 firestore_conn = FirestoreConnection()
-chess_collector = ChessDataCollector(firestore_conn)
+response_cache = ResponseCache(Config.get("CACHE_MAX_ENTRIES"))
+
+def invalidate_player_cache(player_name: str) -> None:
+    """
+    Dopo una scrittura fatta da questo processo rilegge subito la versione del giocatore
+    (vedi _player_generation) e rimuove dalla cache le classifiche, che potrebbero includerlo.
+    """
+    response_cache.invalidate(("player_generation", player_name.lower()))
+    response_cache.invalidate_prefix(("top_players",))
+
+def _player_generation(player_name: str) -> tuple:
+    """
+    Versione del documento del giocatore, riletta al più ogni CACHE_TTL_PLAYER_GENERATION
+    secondi: fa parte delle chiavi della cache dei dati del giocatore, quindi anche le
+    scritture del collector in altri processi (es. i DAG Airflow) invalidano i risultati precedenti.
+    """
+    return response_cache.get_or_load(
+        ("player_generation", player_name.lower()),
+        lambda: firestore_conn.get_player_generation(player_name),
+        ttl=Config.get("CACHE_TTL_PLAYER_GENERATION"),
+        cache_empty=True
+    )
+
+# Il collector usa lo stesso client HTTP (pool di connessioni e rate limiter) del resto del processo
+chess_collector = ChesscomDataCollector(
+    firestore_conn,
+    http_client=get_http_client(),
+    on_player_saved=invalidate_player_cache
+)
 
 @app.get("/top-players/")
-def get_top_players(game_type: str, category:str, limit: int = 10):
+def get_top_players(game_type: str, category:str, response: Response, limit: int = 10, layout: str = "rows"):
     """
     Esegue una query su Firestore e ritorna i giocatori con best_rating più alto
     in base al game_type indicato (es. 'chess_blitz', 'chess_bullet', 'chess_rapid').
+    Con layout=columns top_players contiene una lista per ogni campo invece di una lista di righe.
     """
-    results = firestore_conn.get_top_players(game_type, category, limit)
+    if layout not in ("rows", "columns"):
+        response.status_code = 400
+        return {"message": "layout deve essere 'rows' oppure 'columns'"}
+
+    results = response_cache.get_or_load(
+        ("top_players", game_type, category or None, limit),
+        lambda: firestore_conn.get_top_players(game_type, category, limit),
+        ttl=Config.get("CACHE_TTL_TOP_PLAYERS")
+    )
 
     if not results:
         return {"message": "Nessun risultato trovato per questo game_type"}
     
-    return {
+    return FastJSONResponse({
         "game_type": game_type,
-        "top_players": results
-    }
+        "top_players": to_columns(results) if layout == "columns" else results
+    })
     
 @app.get("/search")
-def search_player(player_name: str, response: Response):
+async def search_player(player_name: str, response: Response, background_tasks: BackgroundTasks):
     """
     Cerca i dati di un giocatore in Firestore. Se non esiste, verifica se è presente su Chess.com.
     Se è su Chess.com, salva i dati in Firestore e restituiscili.
     Se non esiste né in Firestore né su Chess.com, restituisce un messaggio di errore.
     """
-    print(f"asdasd")
-    # 1. Controlla in Firestore
-    data = firestore_conn.get_user_data(player_name)
+    # 1. Controlla in cache e poi in Firestore
+    generation = await asyncio.to_thread(_player_generation, player_name)
+    cache_key = ("search", player_name.lower(), generation)
+    data = await asyncio.to_thread(
+        response_cache.get_or_load,
+        cache_key,
+        lambda: firestore_conn.get_user_data(player_name),
+        Config.get("CACHE_TTL_SEARCH")
+    )
     if data:
-        return {
+        return FastJSONResponse({
             "username": player_name,
             "user_data": data
-        }
-    
-    # 2. Se non esiste in Firestore, cerca su Chess.com
-    status_code, profile = chess_collector.get_player_profile(player_name)
+        })
     
+    # 2. Se non esiste in Firestore, cerca su Chess.com: profilo e statistiche in parallelo
+    (status_code, profile), stats_data = await asyncio.gather(
+        asyncio.to_thread(chess_collector.get_player_profile, player_name),
+        asyncio.to_thread(chess_collector.get_player_stats, player_name),
+    )
 
     if status_code == 404:
         response.status_code = 404
@@ -72,66 +166,247 @@ def search_player(player_name: str, response: Response):
         response.status_code = status_code  # Altro errore HTTP ricevuto da Chess.com
         return {"message": f"Errore nel recupero del profilo per '{player_name}' (HTTP {status_code})"}
 
-    # 3. L'utente esiste su Chess.com: recupera avatar e statistiche
-    stats_data = chess_collector.get_player_stats(player_name) or {}
-    avatar_url = profile.get("avatar")
-    stored_avatar_url = None
-
-    if avatar_url:
-        stored_avatar_url = chess_collector.download_and_store_avatar(avatar_url, player_name)
-    
-    chess_collector.save_to_firestore(
+    # 3. L'utente esiste su Chess.com: salva i dati e restituisci il documento appena scritto
+    new_data = await asyncio.to_thread(
+        chess_collector.save_to_firestore,
         player_name=player_name,
-        stats_data=stats_data,
+        stats_data=stats_data or {},
         profile_data=profile,
-        stored_avatar_url=stored_avatar_url
+        stored_avatar_url=None
     )
+
+    # 4. L'avatar viene salvato nel bucket dopo l'invio della risposta
+    avatar_url = profile.get("avatar")
+    if avatar_url:
+        background_tasks.add_task(chess_collector.store_avatar, player_name, avatar_url)
     
-    # 5. Recupera i dati aggiornati da Firestore
-    new_data = firestore_conn.get_user_data(player_name)
-    
-    response.status_code = 201
-    return {
+    # Ritornando direttamente la risposta lo status va indicato qui; i background_tasks vengono comunque eseguiti
+    return FastJSONResponse({
         "username": player_name,
         "user_data": new_data
+    }, status_code=201)
+
+# Granularità di /player-history/: unità di TIMESTAMP_TRUNC per l'aggregazione in SQL
+HISTORY_RESOLUTIONS = {
+    "raw": None,
+    "daily": "DAY",
+    "weekly": "WEEK(MONDAY)",
+    "monthly": "MONTH",
+}
+
+def _history_generation():
+    """
+    Ultima esecuzione dello snapshot players_history, riletta al più ogni
+    CACHE_TTL_HISTORY_GENERATION secondi: fa parte della chiave della cache
+    dello storico, quindi un nuovo snapshot invalida i risultati precedenti.
+    """
+    state = response_cache.get_or_load(
+        ("history_generation",),
+        lambda: firestore_conn.get_pipeline_state("players_history") or {},
+        ttl=Config.get("CACHE_TTL_HISTORY_GENERATION"),
+        cache_empty=True
+    )
+    last_run = state.get("last_run")
+    return last_run.isoformat() if last_run else None
+
+def _query_player_history(player_name: str, game_type: str, start_date: str, resolution: str):
+    bq_conn = BigQueryConnection()
+    sql = player_history_sql(HISTORY_RESOLUTIONS[resolution])
+
+    params = {
+        "player_name": player_name,
+        "game_type": game_type,
+        "start_date": start_date
     }
+    
+    return bq_conn.execute_query(sql, params)
 
 @app.get("/player-history/")
 def get_player_history(
     player_name: str, 
     game_type: str, 
-    start_date: str = "2025-03-01"
+    response: Response,
+    start_date: str = "2025-03-01",
+    resolution: str = "raw",
+    max_points: Optional[int] = None,
+    layout: str = "rows"
 ):
     """
     Recupera lo storico di un giocatore per un determinato game_type
     a partire da una data specificata (default: 1° marzo 2025).
+    resolution (raw/daily/weekly/monthly) aggrega i punti in SQL; max_points
+    riduce la serie al numero di punti indicato con l'algoritmo LTTB.
+    Con layout=columns history contiene una lista per ogni campo, più compatta
+    da trasferire e già nel formato usato dai grafici.
     """
-    bq_conn = BigQueryConnection()
-    sql = """
-        SELECT player_name, game_type, last_rating, best_rating, 
-               best_game_url, win, loss, draw, timestamp
-        FROM `chess-data-451709.chesscom.players_history`
-        WHERE player_name = @player_name
-        AND game_type = @game_type
-        AND timestamp >= TIMESTAMP(@start_date)
-        ORDER BY timestamp ASC
-    """
-    
-    params = {
-        "player_name": player_name,
-        "game_type": game_type,
-        "start_date": start_date
-    }
-    
-    print(f"query_ {sql}")
-    print(f"params: {params}")
-    results = bq_conn.execute_query(sql, params)
+    if resolution not in HISTORY_RESOLUTIONS:
+        response.status_code = 400
+        return {"message": f"resolution deve essere uno tra: {', '.join(HISTORY_RESOLUTIONS)}"}
+    if max_points is not None and max_points < 3:
+        response.status_code = 400
+        return {"message": "max_points deve essere almeno 3"}
+    if layout not in ("rows", "columns"):
+        response.status_code = 400
+        return {"message": "layout deve essere 'rows' oppure 'columns'"}
+
+    results = response_cache.get_or_load(
+        ("player_history", player_name, game_type, start_date, resolution, _history_generation()),
+        lambda: _query_player_history(player_name, game_type, start_date, resolution),
+        ttl=Config.get("CACHE_TTL_PLAYER_HISTORY")
+    )
     
     if not results:
         return {"message": "Nessun risultato trovato per questo giocatore"}
+
+    if max_points:
+        results = lttb(results, max_points, "timestamp", "last_rating")
     
-    return {
+    return FastJSONResponse({
         "player_name": player_name,
         "game_type": game_type,
-        "history": results
-    }
\ No newline at end of file
+        "history": to_columns(results) if layout == "columns" else results
+    })
+
+@app.get("/player-openings/")
+def get_player_openings(
+    player_name: str,
+    response: Response,
+    color: Optional[str] = None,
+    opening: Optional[str] = None,
+    limit: int = 50
+):
+    """
+    Ritorna le statistiche per apertura di un giocatore (partite, vittorie, sconfitte,
+    patte, punteggio e accuracy media per colore), aggiornate a ogni ingestione delle partite.
+    color (white/black) e opening (testo contenuto nel nome, es. "sicilian") filtrano le righe.
+    """
+    if color is not None and color not in opening_stats.COLORS:
+        response.status_code = 400
+        return {"message": "color deve essere 'white' oppure 'black'"}
+
+    openings = response_cache.get_or_load(
+        ("player_openings", player_name.lower(), _player_generation(player_name)),
+        lambda: firestore_conn.get_player_openings(player_name),
+        ttl=Config.get("CACHE_TTL_PLAYER_OPENINGS")
+    )
+
+    if openings is None:
+        response.status_code = 404
+        return {"message": f"Il giocatore '{player_name}' non è presente in Firestore"}
+
+    return FastJSONResponse({
+        "player_name": player_name,
+        "openings": opening_stats.summarize(openings, color=color, opening=opening, limit=limit)
+    })
+
+def _local_store_error(response: Response, player_name: str, start_date: Optional[str], end_date: Optional[str]):
+    if chess_collector.local_store is None:
+        response.status_code = 503
+        return {"message": "Archivio locale delle partite non configurato (LOCAL_GAME_STORE_DIR e duckdb)"}
+    for value in (start_date, end_date):
+        if value is not None:
+            try:
+                datetime.date.fromisoformat(value)
+            except ValueError:
+                response.status_code = 400
+                return {"message": f"Data non valida: '{value}' (formato YYYY-MM-DD)"}
+    return None
+
+@app.get("/player-games/")
+def get_player_games(
+    player_name: str,
+    response: Response,
+    time_class: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0,
+    include_moves: bool = False,
+    layout: str = "rows"
+):
+    """
+    Ritorna le partite di un giocatore dalla più recente, con colore, avversario,
+    rating ed esito dal suo punto di vista. Le partite sono lette dall'archivio
+    Parquet locale (DuckDB), alimentato dall'ingestione delle partite, senza job BigQuery.
+    """
+    error = _local_store_error(response, player_name, start_date, end_date)
+    if error:
+        return error
+    if not 1 <= limit <= 1000 or offset < 0:
+        response.status_code = 400
+        return {"message": "limit deve essere tra 1 e 1000 e offset non negativo"}
+    if layout not in ("rows", "columns"):
+        response.status_code = 400
+        return {"message": "layout deve essere 'rows' oppure 'columns'"}
+
+    try:
+        games = chess_collector.local_store.player_games(
+            player_name, limit=limit, offset=offset, time_class=time_class,
+            start_date=start_date, end_date=end_date, include_moves=include_moves
+        )
+    except ValueError as e:
+        response.status_code = 400
+        return {"message": str(e)}
+    return FastJSONResponse({
+        "player_name": player_name,
+        "games": to_columns(games) if layout == "columns" else games
+    })
+
+@app.get("/player-game-stats/")
+def get_player_game_stats(
+    player_name: str,
+    response: Response,
+    time_class: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+):
+    """
+    Ritorna per ogni time_class il numero di partite, vittorie, sconfitte e patte,
+    i rating e l'accuracy medi del giocatore, calcolati sull'archivio Parquet locale.
+    """
+    error = _local_store_error(response, player_name, start_date, end_date)
+    if error:
+        return error
+
+    try:
+        stats = chess_collector.local_store.player_stats(
+            player_name, time_class=time_class, start_date=start_date, end_date=end_date
+        )
+    except ValueError as e:
+        response.status_code = 400
+        return {"message": str(e)}
+    if not stats:
+        response.status_code = 404
+        return {"message": f"Nessuna partita di '{player_name}' nell'archivio locale"}
+
+    return FastJSONResponse({"player_name": player_name, "stats": stats})
+
+@app.get("/position-games/")
+def get_position_games(
+    fen: str,
+    response: Response,
+    player_name: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0
+):
+    """
+    Ritorna le partite che raggiungono la posizione del FEN entro le prime
+    POSITION_INDEX_MAX_PLY semimosse, dalla più recente, con le statistiche dei
+    risultati (bianco/patta/nero e, con player_name, vittorie, sconfitte e punteggio
+    del giocatore). La ricerca usa l'indice degli hash di Zobrist costruito durante
+    l'ingestione delle partite.
+    """
+    if chess_collector.position_index is None:
+        response.status_code = 503
+        return {"message": "Indice delle posizioni non configurato (POSITION_INDEX_PATH)"}
+    if not 1 <= limit <= 1000 or offset < 0:
+        response.status_code = 400
+        return {"message": "limit deve essere tra 1 e 1000 e offset non negativo"}
+
+    try:
+        result = chess_collector.position_index.search(fen, player=player_name, limit=limit, offset=offset)
+    except ValueError as e:
+        response.status_code = 400
+        return {"message": str(e)}
+
+    return FastJSONResponse({"fen": fen, "player_name": player_name, **result})
@@ -0,0 +1,77 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from commons.bigquery_connection import BigQueryConnection
+from commons.client_registry import get_firestore_client
+from commons.firestore_batch_writer import FirestoreBatchWriter
+from commons import opening_stats
+from commons.Config import Config
+
+logger = Config.init_logging()
+
+FIRESTORE_CHESSCOM_USERS_COLLECTION = Config.get("FIRESTORE_CHESSCOM_USERS_COLLECTION")
+FIRESTORE_BATCH_SIZE = Config.get("FIRESTORE_BATCH_SIZE")
+CHESS_GAMES_TABLE = f"{Config.get('PROJECT')}.{Config.get('BQ_DATASET_CHESSCOM')}.chess_games"
+
+DRAW_RESULTS_SQL = ", ".join(f"'{result}'" for result in sorted(opening_stats.DRAW_RESULTS))
+
+# Le partite ricaricate più volte vengono contate una sola volta; l'accuracy 0 indica un valore mancante
+OPENINGS_SQL = f"""
+    SELECT user_id, eco, color,
+           COUNT(*) AS games,
+           COUNTIF(result = 'win') AS win,
+           COUNTIF(result IN ({DRAW_RESULTS_SQL})) AS draw,
+           SUM(IF(accuracy > 0, accuracy, 0)) AS accuracy_sum,
+           COUNTIF(accuracy > 0) AS accuracy_games
+    FROM (
+        SELECT user_id, eco,
+               IF(LOWER(white_player) = LOWER(user_id), 'white', 'black') AS color,
+               IF(LOWER(white_player) = LOWER(user_id), result_white, result_black) AS result,
+               IF(LOWER(white_player) = LOWER(user_id), accuracy_white, accuracy_black) AS accuracy
+        FROM `{CHESS_GAMES_TABLE}`
+        WHERE LOWER(white_player) = LOWER(user_id) OR LOWER(black_player) = LOWER(user_id)
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY user_id, game_id ORDER BY end_time) = 1
+    )
+    GROUP BY user_id, eco, color
+"""
+
+
+def backfill_player_openings():
+    """
+    Ricalcola da chess_games gli aggregati per apertura di tutti i giocatori e
+    sostituisce il campo openings dei documenti. Da eseguire una volta, con
+    l'ingestione delle partite ferma: dopo, gli aggregati vengono aggiornati
+    in modo incrementale da fetch_and_store_games.
+    """
+    rows = BigQueryConnection().execute_query(OPENINGS_SQL)
+
+    aggregates = {}
+    for row in rows:
+        counters = {
+            "games": row["games"],
+            "win": row["win"],
+            "loss": row["games"] - row["win"] - row["draw"],
+            "draw": row["draw"],
+            "accuracy_sum": row["accuracy_sum"] or 0.0,
+            "accuracy_games": row["accuracy_games"],
+        }
+        opening_stats.merge(
+            aggregates.setdefault(row["user_id"], {}),
+            {opening_stats.opening_key(row["eco"]): {row["color"]: counters}}
+        )
+
+    db = get_firestore_client()
+    users_ref = db.collection(FIRESTORE_CHESSCOM_USERS_COLLECTION)
+    with FirestoreBatchWriter(db, FIRESTORE_BATCH_SIZE) as writer:
+        for player, openings in aggregates.items():
+            # merge sul solo campo openings: viene sostituito per intero, il resto del documento resta invariato
+            writer.set(users_ref.document(player), {"openings": openings}, merge=["openings"])
+
+    if writer.errors:
+        logger.log_text(f"Aperture non salvate per {len(writer.errors)} giocatori: {writer.errors}", severity="WARNING")
+    logger.log_text(f"Aperture ricalcolate per {len(aggregates)} giocatori da {len(rows)} righe.", severity="INFO")
+
+
+if __name__ == "__main__":
+    backfill_player_openings()
@@ -0,0 +1,50 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from commons.bigquery_connection import BigQueryConnection
+from commons.position_index import PositionIndex
+from commons.Config import Config
+
+logger = Config.init_logging()
+
+POSITION_INDEX_PATH = Config.get("POSITION_INDEX_PATH")
+POSITION_INDEX_MAX_PLY = Config.get("POSITION_INDEX_MAX_PLY")
+CHESS_GAMES_TABLE = f"{Config.get('PROJECT')}.{Config.get('BQ_DATASET_CHESSCOM')}.chess_games"
+BATCH_SIZE = 10000
+
+# Le partite ricaricate più volte vengono lette una sola volta
+GAMES_SQL = f"""
+    SELECT game_id, user_id, white_player, black_player, rating_white, rating_black,
+           result_white, result_black, time_class, UNIX_SECONDS(end_time) AS end_time, url, moves
+    FROM `{CHESS_GAMES_TABLE}`
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY user_id, game_id ORDER BY end_time) = 1
+"""
+
+
+def build_position_index():
+    """
+    Costruisce l'indice delle posizioni dalle partite già caricate in chess_games.
+    Da eseguire una volta: dopo, le nuove partite vengono indicizzate da fetch_and_store_games.
+    Le righe più vecchie, con i numeri di mossa nella colonna moves, vengono normalizzate
+    da PositionIndex. chess_games non registra le regole della partita: le partite
+    Chess960 vengono scartate solo se le loro mosse risultano illegali dalla posizione standard.
+    """
+    if not POSITION_INDEX_PATH:
+        raise SystemExit("POSITION_INDEX_PATH non configurato (variabile CHESSCOM_POSITION_INDEX_PATH)")
+
+    index = PositionIndex(POSITION_INDEX_PATH, POSITION_INDEX_MAX_PLY)
+    # Il risultato della query viene letto e indicizzato una pagina alla volta, senza tenerlo tutto in memoria
+    query_job = BigQueryConnection().connection.query(GAMES_SQL)
+
+    indexed = skipped = 0
+    for page in query_job.result(page_size=BATCH_SIZE).pages:
+        result = index.add_games(dict(row) for row in page)
+        indexed += result["indexed"]
+        skipped += result["skipped"]
+
+    logger.log_text(f"Indice delle posizioni: {indexed} partite indicizzate, {skipped} scartate.", severity="INFO")
+
+
+if __name__ == "__main__":
+    build_position_index()
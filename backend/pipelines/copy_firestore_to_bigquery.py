@@ -1,61 +1,194 @@
-from google.cloud import bigquery, firestore, logging as cloud_logging
+import sys
+import os
+import json
+import argparse
+import datetime
+import tempfile
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-# Inizializzazione dei client
-bq_client = bigquery.Client()
-db = firestore.Client()
-logging_client = cloud_logging.Client()
-logger = logging_client.logger('chess_data_collector')
+from google.cloud import bigquery
+from commons.client_registry import get_bigquery_client, get_firestore_client
+from commons.firestore_batch_writer import FirestoreBatchWriter
+from commons.Config import Config
+
+logger = Config.init_logging()
 
 # Configurazione BigQuery
 BQ_PROJECT = "chess-data-451709"
 BQ_DATASET = "chesscom"
 BQ_TABLE = "players_history"
 
-def copy_firestore_to_bigquery():
-    """Copia i dati da Firestore a BigQuery creando un record per ogni game_type."""
+FIRESTORE_CHESSCOM_USERS_COLLECTION = Config.get("FIRESTORE_CHESSCOM_USERS_COLLECTION")
+GAME_TYPES = Config.get("GAME_TYPES")
+EXPORT_PAGE_SIZE = Config.get("EXPORT_PAGE_SIZE")
+FIRESTORE_BATCH_SIZE = Config.get("FIRESTORE_BATCH_SIZE")
+PIPELINE_STATE_COLLECTION = Config.get("FIRESTORE_PIPELINE_STATE_COLLECTION")
+STATE_DOCUMENT = "players_history"
+EXPORTED_FIELDS = ["timestamp", "last_updated", "history_fingerprint"] + GAME_TYPES
+
+
+def iter_user_docs(db, updated_after=None, page_size: int = EXPORT_PAGE_SIZE):
+    """
+    Legge la collection dei giocatori a pagine di page_size documenti,
+    proiettando solo i campi esportati (niente collected_days).
+    Con updated_after legge solo i documenti con last_updated successivo.
+    """
+    query = db.collection(FIRESTORE_CHESSCOM_USERS_COLLECTION).select(EXPORTED_FIELDS)
+    if updated_after is not None:
+        query = query.where("last_updated", ">", updated_after).order_by("last_updated")
+    else:
+        query = query.order_by("__name__")
+    query = query.limit(page_size)
+
+    last_doc = None
+    while True:
+        page_query = query.start_after(last_doc) if last_doc else query
+        docs = list(page_query.stream())
+        yield from docs
+        if len(docs) < page_size:
+            return
+        last_doc = docs[-1]
+
+
+def stats_fingerprint(stats: dict) -> str:
+    """Impronta di rating e vittorie/sconfitte/patte di un game_type."""
+    return "|".join(str(stats.get(key)) for key in ("last_rating", "best_rating", "win", "loss", "draw"))
+
+
+def doc_to_rows(doc, skip_unchanged: bool = False) -> tuple:
+    """
+    Converte un documento giocatore in un record per ogni game_type.
+    Ritorna i record e le impronte cambiate rispetto all'ultimo export;
+    con skip_unchanged i game_type con impronta invariata non vengono esportati.
+    """
+    doc_data = doc.to_dict()
+    player_name = doc.id
+    timestamp = doc_data.get("timestamp", None)
+    exported = doc_data.get("history_fingerprint") or {}
+
+    rows = []
+    changed_fingerprints = {}
+    for game_type, stats in doc_data.items():
+        if isinstance(stats, dict) and "last_rating" in stats:
+            fingerprint = stats_fingerprint(stats)
+            if fingerprint != exported.get(game_type):
+                changed_fingerprints[game_type] = fingerprint
+            elif skip_unchanged:
+                continue
+            rows.append({
+                "player_name": player_name,
+                "game_type": game_type,
+                "last_rating": stats["last_rating"],
+                "best_rating": stats.get("best_rating", None),
+                "best_game_url": stats.get("best_game_url", None),
+                "win": stats.get("win", 0),
+                "loss": stats.get("loss", 0),
+                "draw": stats.get("draw", 0),
+                "timestamp": timestamp
+            })
+    return rows, changed_fingerprints
+
+
+def get_export_watermark(db):
+    """Ritorna il last_updated più recente esportato dall'ultima esecuzione, oppure None."""
+    doc = db.collection(PIPELINE_STATE_COLLECTION).document(STATE_DOCUMENT).get()
+    return doc.to_dict().get("last_updated_watermark") if doc.exists else None
+
+
+def save_export_state(db, watermark, fingerprints_path: str) -> None:
+    """
+    Salva le impronte esportate sui documenti dei giocatori, lette riga per riga dal file
+    NDJSON scritto durante l'export, e poi il nuovo watermark.
+    """
+    writer = FirestoreBatchWriter(db, FIRESTORE_BATCH_SIZE)
+    users_ref = db.collection(FIRESTORE_CHESSCOM_USERS_COLLECTION)
+    with open(fingerprints_path, encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            writer.set(users_ref.document(entry["player_name"]), {"history_fingerprint": entry["fingerprints"]}, merge=True)
+    writer.flush()
+    if writer.errors:
+        logger.log_text(f"Impronte non salvate per {len(writer.errors)} giocatori: {writer.errors}", severity="WARNING")
+
+    # last_run viene usato dall'API per invalidare la cache di /player-history/
+    state = {"last_run": datetime.datetime.now(datetime.timezone.utc)}
+    if watermark is not None:
+        state["last_updated_watermark"] = watermark
+    db.collection(PIPELINE_STATE_COLLECTION).document(STATE_DOCUMENT).set(state, merge=True)
+
+
+def load_rows_file(bq_client, path: str) -> int:
+    """Carica un file NDJSON in players_history con un unico load job."""
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+        write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+    )
+    table_ref = f"{BQ_PROJECT}.{BQ_DATASET}.{BQ_TABLE}"
+    with open(path, "rb") as f:
+        load_job = bq_client.load_table_from_file(f, table_ref, job_config=job_config)
+    load_job.result()  # Attende il completamento del job
+    return load_job.output_rows
+
+
+def copy_firestore_to_bigquery(incremental: bool = False):
+    """
+    Copia i dati da Firestore a BigQuery creando un record per ogni game_type.
+    I documenti vengono letti a pagine e scritti man mano in un file NDJSON locale,
+    poi caricati con un solo load job; anche le impronte cambiate vengono scritte su file
+    fino al salvataggio: la memoria usata non dipende dal numero di giocatori.
+    Con incremental=True vengono letti solo i giocatori aggiornati dopo l'ultima esecuzione
+    ed esportati solo i game_type con rating o W/L/D cambiati.
+    """
+    db = get_firestore_client()
+    bq_client = get_bigquery_client()
+    updated_after = get_export_watermark(db) if incremental else None
+
+    fd, rows_path = tempfile.mkstemp(suffix=".ndjson")
+    fingerprints_fd, fingerprints_path = tempfile.mkstemp(suffix=".fingerprints.ndjson")
     try:
-        logger.log_text("Avvio della copia Firestore → BigQuery", severity="INFO")
-
-        collection_ref = db.collection("chesscom_users")
-        docs = collection_ref.stream()
-
-        rows_to_insert = []
-        for doc in docs:
-            doc_data = doc.to_dict()
-            player_name = doc.id
-            
-            timestamp = doc_data.get("timestamp", None)
-            
-            for game_type, stats in doc_data.items():
-                if isinstance(stats, dict) and "last_rating" in stats:
-                    row = {
-                        "player_name": player_name,
-                        "game_type": game_type,
-                        "last_rating": stats["last_rating"],
-                        "best_rating": stats.get("best_rating", None),
-                        "best_game_url": stats.get("best_game_url", None),
-                        "win": stats.get("win", 0),
-                        "loss": stats.get("loss", 0),
-                        "draw": stats.get("draw", 0),
-                        "timestamp": timestamp
-                    }
-                    rows_to_insert.append(row)
-
-        if rows_to_insert:
-            # Inserisce i dati in BigQuery
-            table_ref = bq_client.dataset(BQ_DATASET).table(BQ_TABLE)
-            print(f"table_ref {table_ref}")
-            errors = bq_client.insert_rows_json(table_ref, rows_to_insert)
-            if errors:
-                logger.log_text(f"Errore nell'inserimento in BigQuery: {errors}", severity="ERROR")
-            else:
-                logger.log_text(f"Dati copiati con successo in BigQuery: {len(rows_to_insert)} record", severity="INFO")
+        logger.log_text(
+            f"Avvio della copia Firestore → BigQuery (incrementale da {updated_after})" if incremental
+            else "Avvio della copia Firestore → BigQuery",
+            severity="INFO"
+        )
+
+        rows_written = 0
+        docs_read = 0
+        watermark = updated_after
+        with os.fdopen(fd, "w", encoding="utf-8") as f, \
+                os.fdopen(fingerprints_fd, "w", encoding="utf-8") as fingerprints_file:
+            for doc in iter_user_docs(db, updated_after):
+                docs_read += 1
+                rows, changed_fingerprints = doc_to_rows(doc, skip_unchanged=incremental)
+                for row in rows:
+                    f.write(json.dumps(row))
+                    f.write("\n")
+                    rows_written += 1
+                if changed_fingerprints:
+                    fingerprints_file.write(json.dumps({"player_name": doc.id, "fingerprints": changed_fingerprints}))
+                    fingerprints_file.write("\n")
+                last_updated = doc.to_dict().get("last_updated")
+                if last_updated is not None and (watermark is None or last_updated > watermark):
+                    watermark = last_updated
+
+        if rows_written:
+            loaded = load_rows_file(bq_client, rows_path)
+            logger.log_text(f"Dati copiati con successo in BigQuery: {loaded} record da {docs_read} giocatori", severity="INFO")
         else:
-            logger.log_text("Nessun dato da copiare in BigQuery.", severity="WARNING")
+            logger.log_text(f"Nessun dato da copiare in BigQuery ({docs_read} giocatori letti).", severity="WARNING")
+
+        # Lo stato viene aggiornato solo dopo il caricamento riuscito
+        save_export_state(db, watermark, fingerprints_path)
 
     except Exception as e:
         logger.log_text(f"Errore nella copia Firestore → BigQuery: {str(e)}", severity="ERROR")
         raise
+    finally:
+        os.remove(rows_path)
+        os.remove(fingerprints_path)
 
 if __name__ == "__main__":
-    copy_firestore_to_bigquery()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--incremental", action="store_true", help="esporta solo i giocatori cambiati dall'ultima esecuzione")
+    args = parser.parse_args()
+    copy_firestore_to_bigquery(incremental=args.incremental)
@@ -1,5 +1,9 @@
-from backend.commons.chesscom_data_collector import ChessDataCollector
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from commons.chesscom_data_collector import ChesscomDataCollector
 
 if __name__ == "__main__":
-    collector = ChessDataCollector()
-    collector.fetch_chess_data()
\ No newline at end of file
+    collector = ChesscomDataCollector()
+    collector.fetch_chess_data(concurrent=True, batched=True)
\ No newline at end of file
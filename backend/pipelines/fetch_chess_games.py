@@ -1,10 +1,21 @@
 import sys
 import os
+import argparse
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from commons.chesscom_data_collector import ChesscomDataCollector
+from commons.sharding import player_shard
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("players", nargs="*", help="giocatori da elaborare (default: tutti quelli in Firestore)")
+    parser.add_argument("--incremental", action="store_true", help="richiede solo i mesi successivi al watermark")
+    parser.add_argument("--shard", type=int, help="elabora solo questo shard (0..num-shards-1)")
+    parser.add_argument("--num-shards", type=int, default=1)
+    args = parser.parse_args()
+
     collector = ChesscomDataCollector()
-    players = ["davideblunder"]
-    collector.fetch_and_store_games(players)
\ No newline at end of file
+    players = args.players or collector.get_existing_players()
+    if args.shard is not None:
+        players = [p for p in players if player_shard(p, args.num_shards) == args.shard]
+    collector.fetch_and_store_games(players, incremental=args.incremental)
@@ -0,0 +1,83 @@
+import datetime
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from commons.downsampling import PLAYERS_HISTORY_TABLE, player_history_sql
+
+duckdb = pytest.importorskip("duckdb")
+
+
+def _to_duckdb(sql: str) -> str:
+    """Traduce in DuckDB le poche funzioni BigQuery usate dalla query dello storico."""
+    sql = sql.replace(f"`{PLAYERS_HISTORY_TABLE}`", "players_history")
+    sql = re.sub(r"TIMESTAMP_TRUNC\((\w+), (\w+)(?:\(\w+\))?\)", r"date_trunc('\2', \1)", sql)
+    sql = re.sub(r"TIMESTAMP\(@(\w+)\)", r"CAST($\1 AS TIMESTAMP)", sql)
+    return re.sub(r"@(\w+)", r"$\1", sql)
+
+
+def _run(truncate_unit, samples):
+    conn = duckdb.connect()
+    conn.execute("""
+        CREATE TABLE players_history (
+            player_name VARCHAR, game_type VARCHAR, last_rating INTEGER, best_rating INTEGER,
+            best_game_url VARCHAR, win INTEGER, loss INTEGER, draw INTEGER, timestamp TIMESTAMP
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO players_history VALUES ('hikaru', 'chess_blitz', ?, 3300, NULL, ?, 0, 0, ?)",
+        [[rating, win, ts] for ts, rating, win in samples]
+    )
+    params = {"player_name": "hikaru", "game_type": "chess_blitz", "start_date": "2025-03-01"}
+    cursor = conn.execute(_to_duckdb(player_history_sql(truncate_unit)), params)
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def test_daily_history_keeps_last_sample_of_each_day():
+    samples = [
+        # Inseriti fuori ordine: l'ultimo campione del giorno non è l'ultima riga
+        (datetime.datetime(2025, 3, 1, 22, 0), 3010, 12),
+        (datetime.datetime(2025, 3, 1, 8, 0), 3000, 10),
+        (datetime.datetime(2025, 3, 1, 14, 0), 3005, 11),
+        (datetime.datetime(2025, 3, 2, 9, 0), 3020, 13),
+        (datetime.datetime(2025, 3, 3, 23, 59), 3040, 15),
+        (datetime.datetime(2025, 3, 3, 0, 1), 3030, 14),
+        (datetime.datetime(2025, 2, 28, 23, 0), 2990, 9),  # prima di start_date
+    ]
+    rows = _run("DAY", samples)
+
+    assert [(row["timestamp"], row["last_rating"], row["win"]) for row in rows] == [
+        (datetime.datetime(2025, 3, 1), 3010, 12),
+        (datetime.datetime(2025, 3, 2), 3020, 13),
+        (datetime.datetime(2025, 3, 3), 3040, 15),
+    ]
+    assert "period" not in rows[0]
+
+
+def test_weekly_history_buckets_start_on_monday():
+    samples = [
+        (datetime.datetime(2025, 3, 3, 10, 0), 3000, 10),  # lunedì
+        (datetime.datetime(2025, 3, 9, 20, 0), 3015, 12),  # domenica della stessa settimana
+        (datetime.datetime(2025, 3, 10, 9, 0), 3025, 13),
+    ]
+    rows = _run("WEEK(MONDAY)", samples)
+
+    assert [(row["timestamp"], row["last_rating"]) for row in rows] == [
+        (datetime.datetime(2025, 3, 3), 3015),
+        (datetime.datetime(2025, 3, 10), 3025),
+    ]
+
+
+def test_raw_history_returns_every_sample_in_order():
+    samples = [
+        (datetime.datetime(2025, 3, 2, 9, 0), 3020, 13),
+        (datetime.datetime(2025, 3, 1, 8, 0), 3000, 10),
+    ]
+    rows = _run(None, samples)
+
+    assert [row["last_rating"] for row in rows] == [3000, 3020]
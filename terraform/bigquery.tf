@@ -17,7 +17,7 @@ resource "google_bigquery_table" "chess_games" {
     type = "DAY"
     field = "end_time"  # Partizionamento sulla data di fine partita
   }
-  clustering = ["user_id"]  # Clustering su user_id per query più rapide
+  clustering = ["user_id", "time_class"]  # Clustering su user_id e time_class per query più rapide
     schema = <<EOF
     [
       {"name": "game_id", "type": "STRING", "mode": "REQUIRED"},
@@ -0,0 +1,13 @@
+# Gli aggregati per apertura dei giocatori (campo openings di chesscom_users) sono una mappa
+# con una chiave per apertura e colore, aggiornata con Increment a ogni ingestione:
+# nessuna query filtra su questi valori, quindi il campo è escluso dagli indici a campo singolo
+# per non far crescere le voci di indice di ogni documento
+resource "google_firestore_field" "chesscom_users_openings" {
+  project    = var.project_id
+  database   = "(default)"
+  collection = "chesscom_users"
+  field      = "openings"
+
+  # index_config vuoto: nessun indice per il campo e le sue sottochiavi
+  index_config {}
+}